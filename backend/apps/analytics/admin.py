@@ -0,0 +1,7 @@
+from django.contrib import admin
+from .models import FormAggregate
+
+
+@admin.register(FormAggregate)
+class FormAggregateAdmin(admin.ModelAdmin):
+    list_display = ('form', 'total_submissions', 'completion_count', 'updated_at')
@@ -0,0 +1,210 @@
+﻿"""Incrementally maintained analytics.
+
+``record_submissions`` folds newly accepted submissions into the aggregate
+tables inside the request transaction, with a constant number of statements
+per call, and ``discard_submissions`` takes deleted ones back out;
+``form_analytics`` reads them back in constant time; and
+``rebuild_form_aggregates`` recomputes everything from the raw rows. Hourly
+rows older than ``ANALYTICS_HOURLY_RETENTION_HOURS`` are pruned as new ones
+are written.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from apps.forms.validation import CHOICE_TYPES
+from apps.submissions.documents import documents_enabled
+from apps.submissions.models import Answer, FormSubmission
+from .models import ChoiceAggregate, FormAggregate, HourlySubmissionAggregate, QuestionAggregate
+
+
+def _hour(dt):
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def choice_key(value):
+    return str(value)[:255]
+
+
+def _answer_choices(answer_text, answer_choices):
+    # mirrors how answers are stored: answer_text for single choice, answer_choices for multi
+    if answer_text:
+        return [answer_text]
+    if answer_choices and isinstance(answer_choices, list):
+        return answer_choices
+    return []
+
+
+def _shift(field, delta):
+    # decrements are clamped at zero: submissions accepted before the aggregates existed (or while
+    # ANALYTICS_MODE was 'query') were never counted but can still be deleted
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def _increment(model, deltas, field, make_filter):
+    """Apply ``field += delta`` to the rows in ``deltas``, one UPDATE per distinct delta."""
+    by_delta = defaultdict(list)
+    for key, delta in deltas.items():
+        by_delta[delta].append(key)
+    for delta, keys in by_delta.items():
+        model.objects.filter(make_filter(keys)).update(**{field: _shift(field, delta)})
+
+
+def _collect(form, submission_ids):
+    """Tally the aggregate contributions of ``submission_ids`` (hours, completion, responses, choices)."""
+    use_documents = documents_enabled()
+    submissions = FormSubmission.objects.filter(id__in=submission_ids).values_list(
+        'id', 'submitted_at', 'completed_at', *(['answers_document'] if use_documents else []))
+    tally = {'submissions': 0, 'hours': Counter(), 'completion_count': 0, 'completion_sum': 0.0,
+             'responses': Counter(), 'choices': Counter()}
+    documents = []
+    without_documents = []
+    for submission_id, submitted_at, completed_at, *document in submissions:
+        tally['submissions'] += 1
+        tally['hours'][_hour(submitted_at)] += 1
+        if completed_at and submitted_at:
+            tally['completion_count'] += 1
+            tally['completion_sum'] += (completed_at - submitted_at).total_seconds()
+        if document and document[0] is not None:
+            documents.append(document[0])
+        else:
+            without_documents.append(submission_id)
+
+    answers = []
+    if documents:
+        # answer documents replace the answer rows; question types come from one query over the form
+        questions = {str(q_id): (q_id, q_type, options) for q_id, q_type, options in form.questions.values_list('id', 'question_type', 'options')}
+        for document in documents:
+            for question_id, entry in document.items():
+                if question_id in questions:
+                    answers.append((*questions[question_id], entry.get('t'), entry.get('c')))
+    if without_documents:
+        answers.extend(Answer.objects.filter(submission_id__in=without_documents).values_list(
+            'question_id', 'question__question_type', 'question__options', 'answer_text', 'answer_choices'))
+
+    for question_id, question_type, options, answer_text, answer_choices in answers:
+        tally['responses'][question_id] += 1
+        if question_type in CHOICE_TYPES and options:
+            for value in _answer_choices(answer_text, answer_choices):
+                tally['choices'][(question_id, choice_key(value))] += 1
+    return tally
+
+
+def _choice_filter(keys):
+    cond = Q()
+    for question_id, value in keys:
+        cond |= Q(question_id=question_id, value=value)
+    return cond
+
+
+def _apply(form, tally, sign):
+    """Add (``sign=1``) or subtract (``sign=-1``) a tally; rows are only created when adding."""
+    hours, responses, choices = tally['hours'], tally['responses'], tally['choices']
+    if sign < 0:
+        hours, responses, choices = ({k: -v for k, v in c.items()} for c in (hours, responses, choices))
+    with transaction.atomic():
+        if sign > 0:
+            FormAggregate.objects.bulk_create([FormAggregate(form_id=form.pk)], ignore_conflicts=True)
+            HourlySubmissionAggregate.objects.bulk_create([HourlySubmissionAggregate(form_id=form.pk, hour=h) for h in hours], ignore_conflicts=True)
+            if responses:
+                QuestionAggregate.objects.bulk_create([QuestionAggregate(question_id=q, form_id=form.pk) for q in responses], ignore_conflicts=True)
+            if choices:
+                ChoiceAggregate.objects.bulk_create([ChoiceAggregate(question_id=q, form_id=form.pk, value=v) for q, v in choices], ignore_conflicts=True)
+        FormAggregate.objects.filter(form_id=form.pk).update(
+            total_submissions=_shift('total_submissions', sign * tally['submissions']),
+            completion_count=_shift('completion_count', sign * tally['completion_count']),
+            completion_seconds_sum=_shift('completion_seconds_sum', sign * tally['completion_sum']),
+        )
+        _increment(HourlySubmissionAggregate, hours, 'count', lambda keys: Q(form_id=form.pk, hour__in=keys))
+        if responses:
+            _increment(QuestionAggregate, responses, 'response_count', lambda keys: Q(question_id__in=keys))
+        if choices:
+            _increment(ChoiceAggregate, choices, 'count', _choice_filter)
+        if sign > 0:
+            prune_hourly_aggregates(form)
+
+
+def record_submissions(form, submission_ids):
+    """Add the accepted submissions ``submission_ids`` of ``form`` to its aggregates."""
+    submission_ids = list(submission_ids)
+    if not submission_ids or settings.ANALYTICS_MODE != 'incremental':
+        return
+    _apply(form, _collect(form, submission_ids), 1)
+
+
+def discard_submissions(form, submission_ids):
+    """Remove the accepted submissions ``submission_ids`` of ``form`` from its aggregates; call before deleting them."""
+    submission_ids = list(submission_ids)
+    if not submission_ids or settings.ANALYTICS_MODE != 'incremental':
+        return
+    _apply(form, _collect(form, submission_ids), -1)
+
+
+def prune_hourly_aggregates(form):
+    """Drop ``form``'s hourly rows that have left the retention window (only the last 24 hours are reported)."""
+    cutoff = _hour(timezone.now()) - datetime.timedelta(hours=settings.ANALYTICS_HOURLY_RETENTION_HOURS)
+    HourlySubmissionAggregate.objects.filter(form_id=form.pk, hour__lt=cutoff).delete()
+
+
+def rebuild_form_aggregates(form, chunk_size=1000):
+    """Discard and recompute ``form``'s aggregates from its accepted submissions."""
+    with transaction.atomic():
+        FormAggregate.objects.filter(form=form).delete()
+        HourlySubmissionAggregate.objects.filter(form=form).delete()
+        QuestionAggregate.objects.filter(form=form).delete()
+        ChoiceAggregate.objects.filter(form=form).delete()
+        FormAggregate.objects.create(form=form)
+        ids = form.submissions.filter(is_draft=False).order_by('id').values_list('id', flat=True)
+        chunk = []
+        for submission_id in ids.iterator(chunk_size=chunk_size):
+            chunk.append(submission_id)
+            if len(chunk) >= chunk_size:
+                record_submissions(form, chunk)
+                chunk = []
+        record_submissions(form, chunk)
+
+
+def form_analytics(form):
+    """Return the analytics payload for ``form`` from its aggregates (constant number of queries)."""
+    aggregate = FormAggregate.objects.filter(form=form).first()
+    now = timezone.now()
+    since = now - datetime.timedelta(hours=24)
+    first_full_hour = _hour(since) + datetime.timedelta(hours=1)
+    last_24 = HourlySubmissionAggregate.objects.filter(form=form, hour__gte=first_full_hour).aggregate(n=Sum('count'))['n'] or 0
+    # the partial hour at the start of the window is counted exactly
+    last_24 += form.submissions.filter(is_draft=False, submitted_at__gte=since, submitted_at__lt=first_full_hour).count()
+
+    choice_counts = defaultdict(dict)
+    for question_id, value, count in ChoiceAggregate.objects.filter(form=form, count__gt=0).values_list('question_id', 'value', 'count'):
+        choice_counts[question_id][value] = count
+
+    question_stats = []
+    for q in form.questions.select_related('aggregate'):
+        agg = getattr(q, 'aggregate', None)
+        stat = {'id': str(q.id), 'question_text': q.question_text, 'type': q.question_type, 'responses': agg.response_count if agg else 0}
+        if q.question_type in CHOICE_TYPES and q.options:
+            stat['choices'] = choice_counts.get(q.id, {})
+        question_stats.append(stat)
+
+    completion_count = aggregate.completion_count if aggregate else 0
+    return {
+        'total_submissions': aggregate.total_submissions if aggregate else 0,
+        'submissions_last_24h': last_24,
+        'avg_completion_seconds': aggregate.completion_seconds_sum / completion_count if completion_count else None,
+        'question_stats': question_stats,
+    }
+
+
+def get_form_analytics(form):
+    """Analytics payload for ``form`` according to ``settings.ANALYTICS_MODE``."""
+    if settings.ANALYTICS_MODE == 'query':
+        from .queries import compute_form_analytics
+        return compute_form_analytics(form)
+    return form_analytics(form)
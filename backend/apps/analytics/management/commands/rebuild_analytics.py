@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.forms.models import Form
+from apps.analytics.aggregates import rebuild_form_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute incremental analytics aggregates from raw submissions and answers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Form slugs to rebuild (default: all forms)')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        forms = Form.objects.all()
+        if options['slugs']:
+            forms = forms.filter(slug__in=options['slugs'])
+            missing = set(options['slugs']) - set(forms.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f'Unknown form slug(s): {", ".join(sorted(missing))}')
+        count = 0
+        for form in forms.iterator():
+            rebuild_form_aggregates(form, chunk_size=options['chunk_size'])
+            count += 1
+            self.stdout.write(f'Rebuilt {form.slug}')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt analytics for {count} form(s).'))
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('forms', '0005_form_accepted_submissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormAggregate',
+            fields=[
+                ('form', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='aggregate', serialize=False, to='forms.form')),
+                ('total_submissions', models.PositiveIntegerField(default=0)),
+                ('completion_count', models.PositiveIntegerField(default=0)),
+                ('completion_seconds_sum', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionAggregate',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='aggregate', serialize=False, to='forms.question')),
+                ('response_count', models.PositiveIntegerField(default=0)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_aggregates', to='forms.form')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChoiceAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choice_aggregates', to='forms.form')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choice_aggregates', to='forms.question')),
+            ],
+            options={
+                'unique_together': {('question', 'value')},
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySubmissionAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_aggregates', to='forms.form')),
+            ],
+            options={
+                'unique_together': {('form', 'hour')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import models
+
+
+class FormAggregate(models.Model):
+    """Running totals for a form's accepted submissions."""
+    form = models.OneToOneField('forms.Form', on_delete=models.CASCADE, primary_key=True, related_name='aggregate')
+    total_submissions = models.PositiveIntegerField(default=0)
+    completion_count = models.PositiveIntegerField(default=0)
+    completion_seconds_sum = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Aggregate for {self.form_id}: {self.total_submissions}"
+
+
+class HourlySubmissionAggregate(models.Model):
+    """Accepted submissions per form per hour (by submitted_at), used for recent-activity counts."""
+    form = models.ForeignKey('forms.Form', on_delete=models.CASCADE, related_name='hourly_aggregates')
+    hour = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['form', 'hour']
+
+
+class QuestionAggregate(models.Model):
+    question = models.OneToOneField('forms.Question', on_delete=models.CASCADE, primary_key=True, related_name='aggregate')
+    form = models.ForeignKey('forms.Form', on_delete=models.CASCADE, related_name='question_aggregates')
+    response_count = models.PositiveIntegerField(default=0)
+
+
+class ChoiceAggregate(models.Model):
+    question = models.ForeignKey('forms.Question', on_delete=models.CASCADE, related_name='choice_aggregates')
+    form = models.ForeignKey('forms.Form', on_delete=models.CASCADE, related_name='choice_aggregates')
+    value = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['question', 'value']
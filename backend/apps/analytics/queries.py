@@ -0,0 +1,100 @@
+"""Set-based analytics computed directly in the database.
+
+Used when ``ANALYTICS_MODE = 'query'`` (deployments that do not maintain the
+incremental aggregates). Issues a fixed number of grouped queries no matter
+how many questions or answers a form has, and never materializes answer rows
+except on database backends without JSON table functions.
+"""
+import datetime
+import uuid
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q
+from django.utils import timezone
+
+from apps.forms.models import Question
+from apps.forms.validation import CHOICE_TYPES
+from apps.submissions.models import Answer, FormSubmission
+from .aggregates import choice_key
+
+
+# answer_choices expansion per vendor; only applies where answer_text is empty (see aggregates._answer_choices)
+_JSON_CHOICE_SQL = {
+    'sqlite': (
+        'SELECT a.question_id, j.value, COUNT(*) FROM {answer} a '
+        'INNER JOIN {submission} s ON s.id = a.submission_id '
+        'INNER JOIN {question} q ON q.id = a.question_id, json_each(a.answer_choices) j '
+        'WHERE s.form_id = %s AND s.is_draft = %s AND q.question_type IN ({types}) '
+        "AND (a.answer_text IS NULL OR a.answer_text = '') AND json_type(a.answer_choices) = 'array' "
+        'GROUP BY a.question_id, j.value'
+    ),
+    'postgresql': (
+        'SELECT a.question_id, j.value, COUNT(*) FROM {answer} a '
+        'INNER JOIN {submission} s ON s.id = a.submission_id '
+        'INNER JOIN {question} q ON q.id = a.question_id '
+        'CROSS JOIN LATERAL jsonb_array_elements_text('
+        "CASE WHEN jsonb_typeof(a.answer_choices) = 'array' THEN a.answer_choices ELSE '[]'::jsonb END) AS j(value) "
+        'WHERE s.form_id = %s AND s.is_draft = %s AND q.question_type IN ({types}) '
+        "AND (a.answer_text IS NULL OR a.answer_text = '') "
+        'GROUP BY a.question_id, j.value'
+    ),
+}
+
+
+def _json_choice_counts(form, answers):
+    sql = _JSON_CHOICE_SQL.get(connection.vendor)
+    if sql is None:
+        # no JSON table function: stream only the multi-choice columns
+        counts = defaultdict(int)
+        rows = answers.filter(Q(answer_text__isnull=True) | Q(answer_text=''), answer_choices__isnull=False).values_list('question_id', 'answer_choices')
+        for question_id, values in rows.iterator():
+            if isinstance(values, list):
+                for value in values:
+                    counts[(question_id, choice_key(value))] += 1
+        return counts.items()
+    sql = sql.format(
+        answer=Answer._meta.db_table, submission=FormSubmission._meta.db_table, question=Question._meta.db_table,
+        types=', '.join(['%s'] * len(CHOICE_TYPES)),
+    )
+    form_id = FormSubmission._meta.get_field('form').get_db_prep_value(form.pk, connection)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [form_id, False, *CHOICE_TYPES])
+        return [((uuid.UUID(str(qid)), choice_key(value)), n) for qid, value, n in cursor.fetchall()]
+
+
+def compute_form_analytics(form):
+    """Return the same payload as ``aggregates.form_analytics`` using grouped queries only."""
+    since = timezone.now() - datetime.timedelta(hours=24)
+    duration = ExpressionWrapper(F('completed_at') - F('submitted_at'), output_field=DurationField())
+    totals = form.submissions.filter(is_draft=False).aggregate(
+        total=Count('id'),
+        last_24=Count('id', filter=Q(submitted_at__gte=since)),
+        avg_completion=Avg(duration, filter=Q(completed_at__isnull=False)),
+    )
+
+    answers = Answer.objects.filter(submission__form=form, submission__is_draft=False)
+    responses = dict(answers.values('question_id').annotate(n=Count('id')).values_list('question_id', 'n'))
+
+    choice_counts = defaultdict(lambda: defaultdict(int))
+    text_choices = (answers.filter(question__question_type__in=CHOICE_TYPES).exclude(answer_text__isnull=True).exclude(answer_text='')
+                    .values('question_id', 'answer_text').annotate(n=Count('id')).values_list('question_id', 'answer_text', 'n'))
+    for question_id, value, n in text_choices:
+        choice_counts[question_id][choice_key(value)] += n
+    for (question_id, value), n in _json_choice_counts(form, answers):
+        choice_counts[question_id][value] += n
+
+    question_stats = []
+    for q in form.questions.all():
+        stat = {'id': str(q.id), 'question_text': q.question_text, 'type': q.question_type, 'responses': responses.get(q.id, 0)}
+        if q.question_type in CHOICE_TYPES and q.options:
+            stat['choices'] = dict(choice_counts.get(q.id, {}))
+        question_stats.append(stat)
+
+    avg = totals['avg_completion']
+    return {
+        'total_submissions': totals['total'],
+        'submissions_last_24h': totals['last_24'],
+        'avg_completion_seconds': avg.total_seconds() if avg is not None else None,
+        'question_stats': question_stats,
+    }
@@ -0,0 +1,111 @@
+﻿import datetime
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.analytics.models import HourlySubmissionAggregate
+from apps.analytics.queries import compute_form_analytics
+from apps.forms.models import Form, Question
+from apps.submissions.models import Answer, FormSubmission
+from apps.submissions.serializers import delete_submissions
+
+User = get_user_model()
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.form = Form.objects.create(title='A', created_by=self.user, slug='a-form', rate_limit_count=100)
+        self.color = Question.objects.create(form=self.form, question_text='Color', question_type='radio', order=1, options=['red', 'blue'])
+        self.tags = Question.objects.create(form=self.form, question_text='Tags', question_type='checkbox', order=2, options=['x', 'y', 'z'])
+        self.name = Question.objects.create(form=self.form, question_text='Name', question_type='text', order=3)
+
+    def submit(self, color, tags, is_draft=False):
+        data = {'is_draft': is_draft, 'answers': [
+            {'question': str(self.color.id), 'answer_text': color},
+            {'question': str(self.tags.id), 'answer_choices': tags},
+        ]}
+        resp = self.client.post(f'/api/forms/{self.form.slug}/submissions/', data=json.dumps(data), content_type='application/json')
+        self.assertEqual(resp.status_code, 201)
+        return resp.json()['id']
+
+    def get_analytics(self):
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.get(f'/api/forms/{self.form.slug}/analytics/')
+        self.client.force_authenticate(user=None)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_aggregates_follow_submissions(self):
+        self.submit('red', ['x', 'y'])
+        self.submit('red', ['y'])
+        draft = self.submit('blue', ['z'], is_draft=True)
+        data = self.get_analytics()
+        self.assertEqual(data['total_submissions'], 2)
+        self.assertEqual(data['submissions_last_24h'], 2)
+        stats = {s['question_text']: s for s in data['question_stats']}
+        self.assertEqual(stats['Color']['responses'], 2)
+        self.assertEqual(stats['Color']['choices'], {'red': 2})
+        self.assertEqual(stats['Tags']['choices'], {'x': 1, 'y': 2})
+        self.assertEqual(stats['Name']['responses'], 0)
+        self.assertNotIn('choices', stats['Name'])
+
+        # finalizing a draft folds it in
+        self.client.post(f'/api/forms/{self.form.slug}/submissions/{draft}/finalize/')
+        data = self.get_analytics()
+        self.assertEqual(data['total_submissions'], 3)
+        self.assertEqual({s['question_text']: s for s in data['question_stats']}['Color']['choices'], {'red': 2, 'blue': 1})
+
+        # a rebuild from raw rows gives the same result
+        call_command('rebuild_analytics', self.form.slug, stdout=io.StringIO())
+        rebuilt = self.get_analytics()
+        data.pop('avg_completion_seconds')
+        rebuilt.pop('avg_completion_seconds')
+        self.assertEqual(rebuilt, data)
+
+    def test_deleting_submissions_updates_aggregates(self):
+        self.submit('red', ['x', 'y'])
+        doomed = self.submit('blue', ['y'])
+        self.assertEqual(self.client.delete(f'/api/forms/{self.form.slug}/submissions/{doomed}/').status_code, 204)
+        data = self.get_analytics()
+        self.assertEqual((data['total_submissions'], data['submissions_last_24h']), (1, 1))
+        stats = {s['question_text']: s for s in data['question_stats']}
+        self.assertEqual((stats['Color']['responses'], stats['Color']['choices']), (1, {'red': 1}))
+        self.assertEqual(stats['Tags']['choices'], {'x': 1, 'y': 1})
+        # hourly rows outside the retention window are pruned as new submissions are recorded
+        old = HourlySubmissionAggregate.objects.create(form=self.form, hour=timezone.now() - datetime.timedelta(days=30), count=3)
+        self.submit('red', [])
+        self.assertFalse(HourlySubmissionAggregate.objects.filter(pk=old.pk).exists())
+
+    def test_query_mode_matches_incremental(self):
+        self.submit('red', ['x', 'y'])
+        self.submit('blue', ['y'])
+        self.submit('red', [])
+        incremental = self.get_analytics()
+        with override_settings(ANALYTICS_MODE='query'):
+            with CaptureQueriesContext(connection) as ctx:
+                computed = compute_form_analytics(self.form)
+            self.assertEqual(len(ctx.captured_queries), 5)
+            self.assertEqual(self.get_analytics(), computed)
+        incremental.pop('avg_completion_seconds')
+        computed.pop('avg_completion_seconds')
+        self.assertEqual(computed, incremental)
+
+    def test_deleting_uncounted_submissions_clamps_at_zero(self):
+        # accepted before the aggregates existed: never counted, but deletable
+        legacy = FormSubmission.objects.create(form=self.form, is_draft=False)
+        Answer.objects.create(submission=legacy, question=self.color, answer_text='red')
+        self.submit('red', ['x'])
+        delete_submissions(self.form, self.form.submissions.all())
+        data = self.get_analytics()
+        self.assertEqual(data['total_submissions'], 0)
+        stats = {s['question_text']: s for s in data['question_stats']}
+        self.assertEqual((stats['Color']['responses'], stats['Color']['choices']), (0, {}))
@@ -0,0 +1,121 @@
+"""Database configuration and read-replica routing.
+
+``parse_database_url`` turns a ``DATABASE_URL`` (``postgres://``, ``mysql://``
+or ``sqlite:///``) into a ``DATABASES`` entry. ``ReplicaRouter`` sends the reads
+of views wrapped in ``reads_from_replica`` to ``REPORTING_DATABASE_ALIAS``; every
+other read and all writes use ``default``. Once a wrapped view writes, or while
+a transaction is open on ``default``, its reads are pinned to ``default`` so it
+sees its own changes. Replicas lag behind the primary, so only reporting views
+that tolerate slightly stale data should be wrapped.
+"""
+import contextvars
+import functools
+from pathlib import Path
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+ENGINES = {
+    'postgres': 'django.db.backends.postgresql',
+    'postgresql': 'django.db.backends.postgresql',
+    'pgsql': 'django.db.backends.postgresql',
+    'mysql': 'django.db.backends.mysql',
+    'sqlite': 'django.db.backends.sqlite3',
+}
+
+
+def parse_database_url(url, base_dir=None, conn_max_age=0, conn_health_checks=False):
+    """Return a ``DATABASES`` entry for ``url``; query parameters become ``OPTIONS``.
+
+    Relative sqlite paths (``sqlite:///db.sqlite3``) are resolved against ``base_dir``; use four slashes for an
+    absolute path (``sqlite:////var/db/forms.sqlite3``).
+    """
+    parts = urlsplit(url)
+    engine = ENGINES.get(parts.scheme)
+    if engine is None:
+        raise ValueError(f'Unsupported database URL scheme: {parts.scheme!r}')
+    config = {'ENGINE': engine, 'CONN_MAX_AGE': conn_max_age, 'CONN_HEALTH_CHECKS': conn_health_checks}
+    if parts.scheme == 'sqlite':
+        path = unquote(parts.path)[1:] or ':memory:'
+        if path != ':memory:' and not Path(path).is_absolute() and base_dir is not None:
+            path = Path(base_dir) / path
+        config['NAME'] = path
+        return config
+    config.update({
+        'NAME': unquote(parts.path.lstrip('/')),
+        'USER': unquote(parts.username or ''),
+        'PASSWORD': unquote(parts.password or ''),
+        'HOST': parts.hostname or '',
+        'PORT': str(parts.port or ''),
+    })
+    options = dict(parse_qsl(parts.query))
+    if options:
+        config['OPTIONS'] = options
+    return config
+
+
+class _Routing:
+    __slots__ = ('alias', 'pinned')
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.pinned = False
+
+
+_routing = contextvars.ContextVar('replica_routing', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        from django.db import connections
+        routing = _routing.get()
+        # inside a transaction on the primary (including TestCase) reads stay there to see its writes
+        if routing is not None and not routing.pinned and not connections['default'].in_atomic_block:
+            return routing.alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            # read your own writes for the rest of the view
+            routing.pinned = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        from django.conf import settings
+        if db != 'default' and db == settings.REPORTING_DATABASE_ALIAS:
+            return False
+        return None
+
+
+def _stream_with(routing, content):
+    # streamed responses are produced after the view returns; route their queries the same way
+    iterator = iter(content)
+    while True:
+        token = _routing.set(routing)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _routing.reset(token)
+        yield chunk
+
+
+def reads_from_replica(view):
+    """Route the reads of ``view`` (a view function or viewset method) to ``REPORTING_DATABASE_ALIAS``."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        from django.conf import settings
+        routing = _Routing(settings.REPORTING_DATABASE_ALIAS)
+        token = _routing.set(routing)
+        try:
+            response = view(*args, **kwargs)
+        finally:
+            _routing.reset(token)
+        if getattr(response, 'streaming', False) and not getattr(response, 'is_async', False):
+            response.streaming_content = _stream_with(routing, response.streaming_content)
+        return response
+    return wrapper
@@ -0,0 +1,126 @@
+"""In-process per-endpoint request metrics.
+
+``ProfilingMiddleware`` feeds ``registry`` with one observation per sampled
+request: wall time, number of DB queries, DB time and response size, each kept
+as a fixed-bucket histogram per endpoint (``ViewSet.action``). Memory use is
+bounded by the number of endpoints, not by traffic. The metrics are per process;
+with several workers each reports its own numbers.
+"""
+import bisect
+import threading
+from collections import Counter
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+SERIES = {
+    'wall_seconds': LATENCY_BUCKETS,
+    'db_queries': QUERY_BUCKETS,
+    'db_seconds': LATENCY_BUCKETS,
+    'response_bytes': SIZE_BUCKETS,
+}
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile (the max for the +Inf bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        cumulative = []
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            cumulative.append([bound, seen])
+        return {
+            'count': self.count, 'sum': self.sum, 'max': self.max,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99),
+            'buckets': cumulative,
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.status = Counter()
+        self.series = {name: Histogram(bounds) for name, bounds in SERIES.items()}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def observe(self, endpoint, status_code, **values):
+        """Record one request; ``values`` are keyed by the names in ``SERIES`` (missing ones are skipped)."""
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.status[f'{status_code // 100}xx'] += 1
+            for name, value in values.items():
+                if value is not None:
+                    stats.series[name].observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {'requests': stats.requests, 'status': dict(stats.status),
+                           **{name: hist.snapshot() for name, hist in stats.series.items()}}
+                for endpoint, stats in sorted(self._endpoints.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+registry = MetricsRegistry()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshot, prefix='form_maker_http'):
+    """Render a ``MetricsRegistry.snapshot()`` in the Prometheus text exposition format."""
+    lines = [f'# TYPE {prefix}_requests_total counter']
+    for endpoint, stats in snapshot.items():
+        for status_class, n in sorted(stats['status'].items()):
+            lines.append(f'{prefix}_requests_total{{endpoint="{_label(endpoint)}",status="{status_class}"}} {n}')
+    for name in SERIES:
+        metric = f'{prefix}_{name}'
+        lines.append(f'# TYPE {metric} histogram')
+        for endpoint, stats in snapshot.items():
+            hist = stats[name]
+            ep = _label(endpoint)
+            for bound, cumulative in hist['buckets']:
+                lines.append(f'{metric}_bucket{{endpoint="{ep}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{endpoint="{ep}",le="+Inf"}} {hist["count"]}')
+            lines.append(f'{metric}_sum{{endpoint="{ep}"}} {hist["sum"]}')
+            lines.append(f'{metric}_count{{endpoint="{ep}"}} {hist["count"]}')
+    return '\n'.join(lines) + '\n'
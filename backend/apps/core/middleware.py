@@ -0,0 +1,100 @@
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import registry
+
+
+def endpoint_name(request):
+    """``ViewSet.action`` for DRF viewsets, ``module.view`` for other views."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    func = match.func
+    cls = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    if cls is None:
+        return f'{func.__module__}.{getattr(func, "__qualname__", func.__class__.__name__)}'
+    actions = getattr(func, 'actions', None)
+    if actions:
+        return f'{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+    return f'{cls.__name__}.{request.method.lower()}'
+
+
+class QueryProbe:
+    """Database ``execute_wrapper`` counting queries and the time spent in them."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    @contextmanager
+    def installed(self):
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(self))
+            yield
+
+
+class ProfilingMiddleware:
+    """Record wall time, DB queries, DB time and response size per endpoint into ``apps.core.metrics``.
+
+    Controlled by ``PROFILING_ENABLED``, ``PROFILING_SAMPLE_RATE`` (fraction of requests measured) and
+    ``PROFILING_TRACK_QUERIES`` (installing the query wrapper is the main per-request overhead). Streaming
+    responses are measured until their content has been fully sent, including queries made while streaming.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.PROFILING_ENABLED or random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        probe = QueryProbe() if settings.PROFILING_TRACK_QUERIES else None
+        started = time.perf_counter()
+        with probe.installed() if probe else ExitStack():
+            response = self.get_response(request)
+        endpoint = endpoint_name(request)
+
+        def finish(size):
+            registry.observe(
+                endpoint, response.status_code,
+                wall_seconds=time.perf_counter() - started,
+                db_queries=probe.queries if probe else None,
+                db_seconds=probe.db_time if probe else None,
+                response_bytes=size,
+            )
+
+        if response.streaming and not response.is_async:
+            response.streaming_content = self._measure_stream(response.streaming_content, probe, finish)
+        elif response.streaming:
+            finish(None)
+        else:
+            finish(len(response.content))
+        return response
+
+    def _measure_stream(self, content, probe, finish):
+        size = 0
+        iterator = iter(content)
+        try:
+            while True:
+                with probe.installed() if probe else ExitStack():
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        break
+                size += len(chunk)
+                yield chunk
+        finally:
+            finish(size)
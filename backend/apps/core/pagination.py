@@ -0,0 +1,127 @@
+"""Pagination classes.
+
+``PageNumberListPagination`` is the plain ``?page=&page_size=`` pagination used for small per-user lists.
+
+``KeysetPagination`` addresses pages by an opaque cursor holding the ``(submitted_at, id)`` of the
+row at the page boundary, so any page is one index range scan no matter how deep
+it is. Results are newest first. Counting the whole set is left to the caller:
+pass a known (cached) total to ``get_paginated_response`` or let clients opt in
+with ``?count=true``.
+"""
+import base64
+import json
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PageNumberListPagination(PageNumberPagination):
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    page_size = 25
+    max_page_size = 200
+    ordering = ('submitted_at', 'id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row, reverse):
+        position = [getattr(row, field) for field in self.ordering]
+        payload = {'p': [position[0].isoformat(), str(position[1])], 'r': int(reverse)}
+        cursor = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(raw.encode()))
+            when, pk = payload['p']
+            position = (parse_datetime(when), uuid.UUID(pk))
+            if position[0] is None:
+                raise ValueError(when)
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count = queryset.count() if request.query_params.get(self.count_query_param) in ('1', 'true') else None
+
+        first, second = self.ordering
+        cursor = self.decode_cursor(request)
+        reverse = False
+        if cursor is None:
+            qs = queryset.order_by(f'-{first}', f'-{second}')
+        else:
+            (value, pk), reverse = cursor
+            if reverse:
+                # walking back towards newer rows: scan ascending from the boundary, then flip the page
+                qs = queryset.filter(Q(**{f'{first}__gt': value}) | Q(**{first: value, f'{second}__gt': pk})).order_by(first, second)
+            else:
+                qs = queryset.filter(Q(**{f'{first}__lt': value}) | Q(**{first: value, f'{second}__lt': pk})).order_by(f'-{first}', f'-{second}')
+
+        rows = list(qs[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data, count=None):
+        return Response({
+            'count': count if count is not None else self.count,
+            'page_size': self.page_size,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True},
+                'page_size': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -19,3 +19,49 @@ def get_client_ip(request) -> Optional[str]:
     if xri:
         return xri
     return request.META.get('REMOTE_ADDR')
+
+
+def ranged_file_response(request, path, content_type, filename):
+    """Serve ``path`` honouring a single HTTP ``Range: bytes=...`` header so downloads can resume.
+
+    Returns 200 with the whole file, 206 with the requested slice, or 416 for an unsatisfiable range.
+    """
+    import os
+    import re
+    from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+    size = os.path.getsize(path)
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', request.META.get('HTTP_RANGE', '').strip())
+    if not match or match.groups() == ('', ''):
+        response = FileResponse(open(path, 'rb'), content_type=content_type, as_attachment=True, filename=filename)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        # suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    def _chunks(chunk_size=64 * 1024):
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    response = StreamingHttpResponse(_chunks(), status=206, content_type=content_type)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,55 @@
+"""Signed access grants for password-protected forms.
+
+``verify_access`` checks the access code once (a full PBKDF2 hash) and returns a
+grant: a timestamped token signed with ``SECRET_KEY`` that names the form and a
+fingerprint of its stored access code. Later requests send the grant in the
+``X-Form-Access`` header (or ``?access_token=``) and are checked with an HMAC
+only. Changing the access code changes the fingerprint, which revokes every
+grant issued for the old code; grants also expire after ``FORM_ACCESS_GRANT_TTL``
+seconds.
+"""
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+GRANT_SALT = 'apps.forms.access'
+GRANT_HEADER = 'X-Form-Access'
+GRANT_QUERY_PARAM = 'access_token'
+
+
+def access_code_version(access_code):
+    """Short fingerprint of the stored access code; never reveals the code or its hash."""
+    return salted_hmac(GRANT_SALT, access_code or '').hexdigest()[:16]
+
+
+def issue_grant(form):
+    signer = signing.TimestampSigner(salt=GRANT_SALT)
+    return signer.sign_object({'f': str(form.pk), 'v': access_code_version(form.access_code)})
+
+
+def check_grant(token, form_id, code_version):
+    """True if ``token`` is an unexpired grant for ``form_id`` issued under ``code_version``."""
+    if not token:
+        return False
+    try:
+        grant = signing.TimestampSigner(salt=GRANT_SALT).unsign_object(token, max_age=settings.FORM_ACCESS_GRANT_TTL)
+    except (signing.BadSignature, TypeError, ValueError):
+        return False
+    return (isinstance(grant, dict) and grant.get('f') == str(form_id)
+            and constant_time_compare(str(grant.get('v', '')), code_version))
+
+
+def grant_from_request(request):
+    return request.headers.get(GRANT_HEADER) or request.query_params.get(GRANT_QUERY_PARAM)
+
+
+def requires_grant(form):
+    """Protected forms without an access code set are treated as open, like ``Form.check_access_code``."""
+    return bool(form.is_password_protected and form.access_code)
+
+
+def has_form_access(request, form):
+    """Whether ``request`` may read or submit to ``form``: open forms, the owner, or a valid grant."""
+    if not requires_grant(form) or form.created_by_id == request.user.pk:
+        return True
+    return check_grant(grant_from_request(request), form.pk, access_code_version(form.access_code))
@@ -2,12 +2,15 @@
 from django import forms
 from django.core.exceptions import ValidationError
 from .models import Form, Question
+from apps.analytics.aggregates import rebuild_form_aggregates
 
 
 @admin.action(description='Delete non-draft submissions for selected forms')
 def reset_submissions(modeladmin, request, queryset):
     for form in queryset:
         form.submissions.filter(is_draft=False).delete()
+        form.recount_accepted_submissions()
+        rebuild_form_aggregates(form)
 
 
 @admin.action(description='Clear submission limit for selected forms')
@@ -17,7 +20,7 @@ def clear_submission_limit(modeladmin, request, queryset):
 
 @admin.register(Form)
 class FormAdmin(admin.ModelAdmin):
-    list_display = ('title', 'created_by', 'is_published', 'submission_limit', 'created_at')
+    list_display = ('title', 'created_by', 'is_published', 'submission_limit', 'accepted_submissions', 'created_at')
     list_filter = ('is_published',)
     search_fields = ('title', 'slug')
     actions = [reset_submissions, clear_submission_limit]
@@ -4,3 +4,6 @@
 class FormsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.forms'
+
+    def ready(self):
+        from . import signals  # noqa: F401
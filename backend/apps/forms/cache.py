@@ -0,0 +1,127 @@
+"""Two-tier caching for rendered form payloads.
+
+Entries are versioned by the caller (normally ``form_version(form)``, derived
+from ``Form.updated_at``). A bounded process-local LRU sits in front of the
+shared Django cache; a version mismatch is treated as a miss, so workers that
+missed an invalidation signal never serve stale data.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from apps.core.cache import LRUCache
+
+
+def version_for(updated_at):
+    return format(int(updated_at.timestamp() * 1000000), 'x')
+
+
+def form_version(form):
+    """Compact version identifier for the current state of ``form`` and its questions."""
+    return version_for(form.updated_at)
+
+
+class TwoTierCache:
+    instances = []
+
+    def __init__(self, name, maxsize=None, timeout=None):
+        self.name = name
+        TwoTierCache.instances.append(self)
+        self.timeout = timeout if timeout is not None else getattr(settings, 'FORM_CACHE_TIMEOUT', 3600)
+        self.local = LRUCache(maxsize=maxsize or getattr(settings, 'FORM_CACHE_LOCAL_SIZE', 1024))
+        self._stats_lock = threading.Lock()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @property
+    def shared(self):
+        return caches[getattr(settings, 'FORM_CACHE_ALIAS', 'default')]
+
+    def _shared_key(self, key, version):
+        return f'forms:{self.name}:{key}:{version}'
+
+    def _count(self, stat):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def get(self, key, version):
+        entry = self.local.get(key)
+        if entry is not None and entry[0] == version:
+            self._count('local_hits')
+            return entry[1]
+        value = self.shared.get(self._shared_key(key, version))
+        if value is not None:
+            self._count('shared_hits')
+            self.local.set(key, (version, value))
+            return value
+        self._count('misses')
+        return None
+
+    def set(self, key, version, value):
+        self.local.set(key, (version, value))
+        self.shared.set(self._shared_key(key, version), value, self.timeout)
+
+    def get_or_set(self, key, version, build):
+        value = self.get(key, version)
+        if value is None:
+            value = build()
+            self.set(key, version, value)
+        return value
+
+    def invalidate(self, key, version=None):
+        self.local.pop(key)
+        if version is not None:
+            self.shared.delete(self._shared_key(key, version))
+
+    def snapshot(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['local_size'] = len(self.local)
+        return stats
+
+
+class SlugVersionedCache(TwoTierCache):
+    """Two-tier cache keyed by form slug whose current version is published in the shared cache.
+
+    Readers look the version marker up in the shared cache instead of loading the form, so a local hit costs
+    one shared-cache read and no query. Writers move the marker to the row's new version; an entry built from
+    an older (or not yet committed) row is stored under that row's own version and never matches it.
+
+    The marker is only trusted when the shared cache really is shared between workers. With a per-process
+    backend (``LocMemCache``, the default without ``CACHE_URL``) another worker's invalidation never reaches
+    this process, so ``lookup`` reads the current version from the database instead.
+    """
+
+    @property
+    def marker_is_shared(self):
+        return not isinstance(self.shared, (LocMemCache, DummyCache))
+
+    def _marker_key(self, slug):
+        return f'forms:{self.name}:version:{slug}'
+
+    def lookup(self, slug, load_version):
+        """Cached value for ``slug`` or None; ``load_version()`` returns its current version (None if it is gone)."""
+        version = self.shared.get(self._marker_key(slug)) if self.marker_is_shared else load_version()
+        if version is None:
+            self._count('misses')
+            return None
+        return self.get(slug, version)
+
+    def store(self, slug, version, value):
+        self.set(slug, version, value)
+        # add, not set: a reader holding an older row must not replace a newer marker
+        self.shared.add(self._marker_key(slug), version, self.timeout)
+
+    def invalidate(self, slug, version=None):
+        """Drop ``slug``; with ``version`` the marker moves to it, otherwise the marker is removed."""
+        self.local.pop(slug)
+        if version is None:
+            self.shared.delete(self._marker_key(slug))
+        else:
+            self.shared.set(self._marker_key(slug), version, self.timeout)
+
+
+client_schema_cache = TwoTierCache('client-schema')
+form_detail_cache = SlugVersionedCache('form-detail')
@@ -0,0 +1,179 @@
+import datetime
+import json
+import math
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from apps.forms.models import Form, Question
+from apps.forms.validation import answer_field
+from apps.analytics.aggregates import rebuild_form_aggregates
+
+OPTIONS = ['alpha', 'beta', 'gamma', 'delta', 'epsilon']
+OPERATIONS = ['submission_create', 'client_schema', 'analytics', 'report_page', 'csv_export']
+
+
+def percentile(samples, pct):
+    # nearest-rank percentile
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def sample_answer(question, rng):
+    """A valid API answer payload for ``question``."""
+    qt = question.question_type
+    if qt == 'email':
+        value = f'user{rng.randrange(10 ** 6)}@example.com'
+    elif qt == 'number':
+        value = rng.randrange(1000)
+    elif qt == 'date':
+        value = (datetime.date.today() + datetime.timedelta(days=rng.randrange(1, 365))).isoformat()
+    elif qt in ('radio', 'dropdown'):
+        value = rng.choice(OPTIONS)
+    elif qt in ('checkbox', 'multiselect'):
+        value = rng.sample(OPTIONS, rng.randrange(1, len(OPTIONS)))
+    else:
+        value = f'answer {rng.randrange(10 ** 6)}'
+    return {'question': str(question.id), answer_field(qt): value}
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the hot API paths against a throwaway test database: generates a synthetic form and '
+            'submissions, then times each operation through the real URL routes and prints JSON '
+            '(ops/sec, p50/p95/p99 latency in ms and queries per operation).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=20, help='Questions per generated form')
+        parser.add_argument('--types', default=','.join(t for t, _ in Question.QUESTION_TYPES),
+                            help='Comma-separated question types to cycle through')
+        parser.add_argument('--submissions', type=int, default=1000, help='Synthetic submissions bulk-loaded before timing')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed iterations per operation')
+        parser.add_argument('--page-size', type=int, default=50, help='Report page size')
+        parser.add_argument('--operations', default=','.join(OPERATIONS), help='Comma-separated subset of operations to run')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        types = [t for t in options['types'].split(',') if t]
+        valid_types = {t for t, _ in Question.QUESTION_TYPES}
+        unknown = set(types) - valid_types
+        if unknown or not types:
+            raise CommandError(f'Unknown question type(s): {", ".join(sorted(unknown)) or "(none)"}')
+        operations = [op for op in options['operations'].split(',') if op]
+        if set(operations) - set(OPERATIONS):
+            raise CommandError(f'Unknown operation(s); choose from {", ".join(OPERATIONS)}')
+
+        # never touch the configured database: run against a disposable test database
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = self.run(types, operations, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def run(self, types, operations, options):
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        form, questions = self.build_form(types, options['questions'])
+        self.load_submissions(form, questions, options['submissions'], rng)
+        setup_seconds = time.perf_counter() - started
+
+        client = APIClient()
+        client.force_authenticate(user=form.created_by)
+        base = f'/api/forms/{form.slug}'
+        report_urls = [f'{base}/submissions/report/?page_size={options["page_size"]}']
+
+        def submission_create():
+            data = {'is_draft': False, 'answers': [sample_answer(q, rng) for q in questions]}
+            return client.post(f'{base}/submissions/', data=json.dumps(data), content_type='application/json')
+
+        def report_page():
+            # walk the cursor chain so later iterations measure deep pages
+            resp = client.get(report_urls[-1])
+            next_url = resp.json().get('next')
+            report_urls.append(next_url or report_urls[0])
+            return resp
+
+        def csv_export():
+            resp = client.get(f'{base}/submissions/export/')
+            b''.join(resp.streaming_content)
+            return resp
+
+        runners = {
+            'submission_create': submission_create,
+            'client_schema': lambda: client.get(f'{base}/client-schema/'),
+            'analytics': lambda: client.get(f'{base}/analytics/'),
+            'report_page': report_page,
+            'csv_export': csv_export,
+        }
+        results = {name: self.measure(runners[name], options['iterations']) for name in operations}
+        return {
+            'config': {'questions': len(questions), 'types': types, 'submissions': options['submissions'],
+                       'iterations': options['iterations'], 'page_size': options['page_size'], 'seed': options['seed'],
+                       'database': connection.vendor},
+            'setup_seconds': round(setup_seconds, 3),
+            'operations': results,
+        }
+
+    def build_form(self, types, count):
+        user = get_user_model().objects.create_user(username='bench', email='bench@example.com', password='bench')
+        form = Form.objects.create(title='Benchmark form', created_by=user, slug='bench-form', rate_limit_enabled=False)
+        Question.objects.bulk_create([
+            Question(form=form, question_text=f'Question {i + 1}', question_type=types[i % len(types)], order=i + 1,
+                     options=OPTIONS if types[i % len(types)] in ('radio', 'checkbox', 'dropdown', 'multiselect') else None)
+            for i in range(count)
+        ])
+        form.refresh_from_db()
+        return form, list(form.questions.order_by('order'))
+
+    def load_submissions(self, form, questions, count, rng, chunk=500):
+        from apps.submissions.serializers import bulk_create_submissions
+
+        for start in range(0, count, chunk):
+            items = []
+            for _ in range(min(chunk, count - start)):
+                answers = [sample_answer(q, rng) for q in questions]
+                for a in answers:
+                    if 'answer_date' in a:
+                        a['answer_date'] = datetime.date.fromisoformat(a['answer_date'])
+                items.append({'is_draft': False, 'answers': answers})
+            bulk_create_submissions(items, form=form, ip_address='127.0.0.1')
+        form.recount_accepted_submissions()
+        rebuild_form_aggregates(form)
+
+    def measure(self, run, iterations):
+        timings = []
+        queries = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connections['default']) as ctx:
+                started = time.perf_counter()
+                resp = run()
+                timings.append(time.perf_counter() - started)
+            if resp.status_code >= 400:
+                raise CommandError(f'{resp.request["PATH_INFO"]} returned {resp.status_code}')
+            queries.append(len(ctx.captured_queries))
+        total = sum(timings)
+        return {
+            'iterations': iterations,
+            'ops_per_sec': round(iterations / total, 2) if total else None,
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 95) * 1000, 3),
+            'p99_ms': round(percentile(timings, 99) * 1000, 3),
+            'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+            'queries_per_op': round(statistics.fmean(queries), 2),
+            'max_queries': max(queries),
+        }
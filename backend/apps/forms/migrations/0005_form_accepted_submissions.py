@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_accepted_submissions(apps, schema_editor):
+    Form = apps.get_model('forms', 'Form')
+    counts = Form.objects.annotate(n=Count('submissions', filter=Q(submissions__is_draft=False))).values_list('pk', 'n')
+    for pk, n in counts:
+        if n:
+            Form.objects.filter(pk=pk).update(accepted_submissions=n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0004_add_publish_and_limit'),
+        ('submissions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='form',
+            name='accepted_submissions',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_accepted_submissions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0005_form_accepted_submissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='form',
+            name='digest_interval_minutes',
+            field=models.PositiveIntegerField(default=60),
+        ),
+        migrations.AddField(
+            model_name='form',
+            name='digest_max_submissions',
+            field=models.PositiveIntegerField(default=100),
+        ),
+        migrations.AddField(
+            model_name='form',
+            name='notification_mode',
+            field=models.CharField(choices=[('immediate', 'Immediate'), ('digest', 'Digest')], default='immediate', max_length=10),
+        ),
+    ]
@@ -2,12 +2,15 @@
 import datetime
 from decimal import Decimal, InvalidOperation
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest
 from django.conf import settings
 from django.utils import timezone
+from django.utils.text import slugify
 from django.contrib.auth.hashers import make_password, check_password
 from django.core.exceptions import ValidationError
-from django.core.validators import EmailValidator
+
+from .validation import CompiledQuestion
 
 
 class Form(models.Model):
@@ -28,16 +31,28 @@ class Form(models.Model):
     access_code = models.CharField(max_length=255, blank=True, null=True)
     enable_email_notifications = models.BooleanField(default=False)
     notification_emails = models.JSONField(default=list, blank=True)
+    # 'digest' coalesces new submissions into one summary email per interval or per batch of submissions
+    notification_mode = models.CharField(max_length=10, choices=[('immediate', 'Immediate'), ('digest', 'Digest')], default='immediate')
+    digest_interval_minutes = models.PositiveIntegerField(default=60)
+    digest_max_submissions = models.PositiveIntegerField(default=100)
     rate_limit_enabled = models.BooleanField(default=True)
     rate_limit_count = models.PositiveIntegerField(default=5)
     rate_limit_period = models.PositiveIntegerField(default=3600)
     allow_partial_saves = models.BooleanField(default=True)
     # optional cap on the number of accepted (non-draft) submissions
     submission_limit = models.PositiveIntegerField(null=True, blank=True, help_text='Optional maximum number of non-draft submissions allowed for this form')
+    # maintained count of accepted (non-draft) submissions; admission against submission_limit is a single conditional UPDATE
+    accepted_submissions = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # accepted_submissions is maintained by conditional UPDATEs; never write it back from a possibly stale instance
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'accepted_submissions']
+        super().save(*args, **kwargs)
+
     def is_expired(self):
         if not self.expires_at:
             return False
@@ -52,16 +67,109 @@ class Form(models.Model):
             return True
         return check_password(code, self.access_code)
 
+    def has_submission_capacity(self):
+        """Cheap pre-check against the loaded row; reserve_submission_slots() is authoritative."""
+        return self.submission_limit is None or self.accepted_submissions < self.submission_limit
+
+    def reserve_submission_slots(self, count=1):
+        """Atomically claim ``count`` accepted-submission slots. Returns False if the cap would be exceeded."""
+        fits = models.Q(submission_limit__isnull=True) | models.Q(submission_limit__gte=models.F('accepted_submissions') + count)
+        return Form.objects.filter(fits, pk=self.pk).update(accepted_submissions=models.F('accepted_submissions') + count) == 1
+
+    def reserve_available_submission_slots(self, count):
+        """Claim up to ``count`` slots and return how many were granted (0 only when the form is full)."""
+        while True:
+            row = Form.objects.filter(pk=self.pk).values('accepted_submissions', 'submission_limit').first()
+            if row is None:
+                return 0
+            if row['submission_limit'] is None:
+                Form.objects.filter(pk=self.pk).update(accepted_submissions=models.F('accepted_submissions') + count)
+                return count
+            granted = min(count, row['submission_limit'] - row['accepted_submissions'])
+            if granted <= 0:
+                return 0
+            # succeeds unless concurrent submissions took the room we saw; then re-read and grant what is left
+            if self.reserve_submission_slots(granted):
+                return granted
+
+    def release_submission_slots(self, count=1):
+        Form.objects.filter(pk=self.pk).update(accepted_submissions=Greatest(models.F('accepted_submissions') - count, 0))
+
+    def reorder_questions(self, question_ids):
+        """Renumber the questions 1..n in the order of ``question_ids``, which must list each question once.
+
+        Runs a constant number of statements: every row is first moved above the current order values so
+        the renumbering never collides with unique (form, order), then all rows are set with one bulk CASE update.
+        Returns False (and changes nothing) if ``question_ids`` does not match the form's questions.
+        """
+        from .signals import touch_form
+
+        with transaction.atomic():
+            questions = {str(q.id): q for q in self.questions.select_for_update().only('id', 'form_id', 'order')}
+            ids = [str(qid) for qid in question_ids]
+            if len(ids) != len(questions) or set(ids) != set(questions):
+                return False
+            if questions:
+                offset = max(max(q.order for q in questions.values()), len(ids)) + 1
+                self.questions.update(order=models.F('order') + offset)
+                now = timezone.now()
+                for position, qid in enumerate(ids, start=1):
+                    questions[qid].order = position
+                    questions[qid].updated_at = now
+                Question.objects.bulk_update(questions.values(), ['order', 'updated_at'])
+            touch_form(self.pk, self.slug)
+        return True
+
+    def clone(self, owner, title=None, slug=None, is_template=None):
+        """Copy this form and all of its questions for ``owner`` with one insert per table.
+
+        Submissions, counters and timestamps are not copied. ``slug`` defaults to a free slug derived from this
+        form's; ``is_template`` defaults to this form's flag.
+        """
+        skip = {'id', 'slug', 'created_by', 'created_at', 'updated_at', 'accepted_submissions'}
+        values = {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields if f.name not in skip}
+        values.update(title=title or self.title, created_by=owner)
+        if is_template is not None:
+            values['is_template'] = is_template
+        question_skip = {'id', 'form', 'created_at', 'updated_at'}
+        question_fields = [f.attname for f in Question._meta.concrete_fields if f.name not in question_skip]
+        with transaction.atomic():
+            copy = Form.objects.create(slug=slug or unique_slug(f'{self.slug}-copy'), **values)
+            Question.objects.bulk_create([
+                Question(form=copy, **{name: getattr(q, name) for name in question_fields})
+                for q in self.questions.all()
+            ])
+        return copy
+
+    def recount_accepted_submissions(self):
+        """Resynchronise the counter with the submissions table (e.g. after bulk deletes)."""
+        self.accepted_submissions = self.submissions.filter(is_draft=False).count()
+        Form.objects.filter(pk=self.pk).update(accepted_submissions=self.accepted_submissions)
+        return self.accepted_submissions
+
     def is_rate_limited(self, ip_address):
-        # minimal check placeholder; actual implementation should query SubmissionRateLimit
-        from apps.ratelimit.models import SubmissionRateLimit
+        """Return True if another submission from ``ip_address`` would exceed the rate limit."""
+        from apps.ratelimit.limiter import peek_form
         if not self.rate_limit_enabled:
             return False
-        try:
-            entry = SubmissionRateLimit.objects.get(form=self, ip_address=ip_address)
-        except SubmissionRateLimit.DoesNotExist:
-            return False
-        return not entry.is_within_limit(self.rate_limit_count)
+        return not peek_form(self, ip_address).allowed
+
+
+def unique_slug(base):
+    """Return ``base`` (slugified) or the first free ``base-N``, reading the taken candidates in one query."""
+    max_length = Form._meta.get_field('slug').max_length
+    base = slugify(base)[:max_length].strip('-') or 'form'
+    stem = base[:max_length - 6]
+    taken = set(Form.objects.filter(slug__startswith=stem).values_list('slug', flat=True))
+    if base not in taken:
+        return base
+    n = 2
+    while True:
+        suffix = f'-{n}'
+        candidate = base[:max_length - len(suffix)] + suffix
+        if candidate not in taken:
+            return candidate
+        n += 1
 
 
 class Question(models.Model):
@@ -153,56 +261,4 @@ class Question(models.Model):
 
     def validate_answer(self, value):
         """Runtime validator for an answer value according to question_type. Returns None or raises ValidationError."""
-        qt = self.question_type
-        if qt == 'email':
-            v = EmailValidator()
-            try:
-                v(value)
-            except Exception as e:
-                raise ValidationError(f'Invalid email: {e}')
-
-        if qt == 'number':
-            try:
-                num = Decimal(str(value))
-            except Exception:
-                raise ValidationError('Answer must be a number.')
-            if self.min_value is not None and num < self.min_value:
-                raise ValidationError(f'Number is below minimum of {self.min_value}.')
-            if self.max_value is not None and num > self.max_value:
-                raise ValidationError(f'Number is above maximum of {self.max_value}.')
-
-        if qt == 'date':
-            try:
-                if isinstance(value, str):
-                    d = datetime.date.fromisoformat(value)
-                elif isinstance(value, datetime.date):
-                    d = value
-                else:
-                    raise ValueError()
-            except Exception:
-                raise ValidationError('Invalid date format, expected YYYY-MM-DD or date object.')
-            opts = self.options or {}
-            if not opts.get('allow_past', True) and d < datetime.date.today():
-                raise ValidationError('Past dates are not allowed for this question.')
-            if 'min_date' in opts and opts.get('min_date'):
-                if d < datetime.date.fromisoformat(opts['min_date']):
-                    raise ValidationError(f'Date is before allowed minimum {opts["min_date"]}.')
-            if 'max_date' in opts and opts.get('max_date'):
-                if d > datetime.date.fromisoformat(opts['max_date']):
-                    raise ValidationError(f'Date is after allowed maximum {opts["max_date"]}.')
-
-        if qt in ('dropdown', 'radio'):
-            opts = self.options or []
-            values = [o['value'] if isinstance(o, dict) else o for o in opts]
-            if value not in values:
-                raise ValidationError('Selected value is not a valid option.')
-
-        if qt in ('checkbox', 'multiselect'):
-            # expect value to be a list of choices
-            if not isinstance(value, (list, tuple)):
-                raise ValidationError('Answer must be a list of selected options.')
-            opts = self.options or []
-            values = [o['value'] if isinstance(o, dict) else o for o in opts]
-            for v in value:
-                if v not in values:
-                    raise ValidationError(f'Selected value {v} is not a valid option.')
+        CompiledQuestion(self).validate(value)
@@ -1,5 +1,7 @@
 ﻿from rest_framework import serializers
 from .models import Form, Question
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 
 
@@ -27,8 +29,16 @@ class QuestionSerializer(serializers.ModelSerializer):
         return data
 
 
+class NestedQuestionSerializer(QuestionSerializer):
+    """Question inside a form payload; ``id`` identifies an existing question to update in place."""
+    id = serializers.UUIDField(required=False)
+
+    class Meta(QuestionSerializer.Meta):
+        read_only_fields = ('created_at', 'updated_at', 'form')
+
+
 class FormSerializer(serializers.ModelSerializer):
-    questions = QuestionSerializer(many=True, required=False)
+    questions = NestedQuestionSerializer(many=True, required=False)
     created_by = serializers.StringRelatedField(read_only=True)
 
     class Meta:
@@ -36,7 +46,8 @@ class FormSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'description', 'created_by', 'is_template', 'is_active', 'allow_multiple_submissions',
                   'is_published', 'submission_limit',
                   'created_at', 'updated_at', 'slug', 'expires_at', 'is_password_protected', 'access_code',
-                  'enable_email_notifications', 'notification_emails', 'rate_limit_enabled', 'rate_limit_count',
+                  'enable_email_notifications', 'notification_emails', 'notification_mode', 'digest_interval_minutes',
+                  'digest_max_submissions', 'rate_limit_enabled', 'rate_limit_count',
                   'rate_limit_period', 'allow_partial_saves', 'questions')
         read_only_fields = ('id', 'created_by', 'created_at', 'updated_at')
 
@@ -44,24 +55,132 @@ class FormSerializer(serializers.ModelSerializer):
         # slug uniqueness handled by model
         return data
 
+    def validate_questions(self, questions):
+        missing = [q for q in questions if 'order' not in q]
+        if missing:
+            # partial updates may omit the order of an existing question: keep its stored one
+            current = dict(self.instance.questions.values_list('id', 'order')) if self.instance is not None else {}
+            for q in missing:
+                if q.get('id') not in current:
+                    raise serializers.ValidationError('New questions need an order.')
+                q['order'] = current[q['id']]
+        orders = [q['order'] for q in questions]
+        if len(orders) != len(set(orders)):
+            raise serializers.ValidationError('Question order values must be unique.')
+        ids = [q['id'] for q in questions if q.get('id')]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError('Duplicate question id.')
+        return questions
+
     def create(self, validated_data):
         questions_data = validated_data.pop('questions', [])
         request = self.context.get('request')
         user = request.user
         validated_data['created_by'] = user
-        form = Form.objects.create(**validated_data)
-        for q in questions_data:
-            Question.objects.create(form=form, **q)
+        with transaction.atomic():
+            form = Form.objects.create(**validated_data)
+            Question.objects.bulk_create([Question(form=form, **{k: v for k, v in q.items() if k != 'id'}) for q in questions_data])
         return form
 
     def update(self, instance, validated_data):
         questions_data = validated_data.pop('questions', None)
         for k, v in validated_data.items():
             setattr(instance, k, v)
-        instance.save()
-        if questions_data is not None:
-            # simple strategy: remove existing and recreate
-            instance.questions.all().delete()
-            for q in questions_data:
-                Question.objects.create(form=instance, **q)
+        with transaction.atomic():
+            instance.save()
+            if questions_data is not None:
+                sync_questions(instance, questions_data)
         return instance
+
+
+class FormSummarySerializer(serializers.ModelSerializer):
+    """Dashboard listing of a form: no questions; counts come from queryset annotations (see FormViewSet.list)."""
+    submissions_count = serializers.IntegerField(read_only=True)
+    drafts_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Form
+        fields = ('id', 'title', 'description', 'slug', 'is_template', 'is_active', 'is_published', 'expires_at',
+                  'created_at', 'updated_at', 'submission_limit', 'submissions_count', 'drafts_count')
+        read_only_fields = fields
+
+
+def sync_questions(form, questions_data):
+    """Make ``form``'s questions match ``questions_data`` with a constant number of statements.
+
+    Incoming questions are matched to existing ones by ``id``: changed rows are bulk-updated, unmatched entries
+    are bulk-created and questions missing from the payload are deleted, so answers to kept questions survive.
+    Call inside a transaction.
+    """
+    from .signals import defer_form_touch, touch_form
+
+    existing = {q.id: q for q in form.questions.all()}
+    kept, to_update, to_create = set(), [], []
+    changed_fields = set()
+    moved = []
+    for data in questions_data:
+        data = dict(data)
+        question = existing.get(data.pop('id', None))
+        if question is None:
+            # unknown ids (e.g. copied from another form) are treated as new questions
+            to_create.append(Question(form=form, **data))
+            continue
+        kept.add(question.id)
+        changed = [field for field, value in data.items() if getattr(question, field) != value]
+        if not changed:
+            continue
+        if 'order' in changed:
+            moved.append(question.id)
+        for field in changed:
+            setattr(question, field, data[field])
+        changed_fields.update(changed)
+        to_update.append(question)
+
+    removed = [qid for qid in existing if qid not in kept]
+    if removed:
+        # answers cascade through the collector; the form is touched once below, not per question
+        with defer_form_touch():
+            Question.objects.filter(id__in=removed).delete()
+    if moved:
+        # park moved rows above every old and new order first so no statement trips unique (form, order)
+        offset = max([q.order for q in existing.values()] + [d['order'] for d in questions_data]) + 1
+        Question.objects.filter(id__in=moved).update(order=F('order') + offset)
+    if to_update:
+        now = timezone.now()
+        for question in to_update:
+            question.updated_at = now
+        Question.objects.bulk_update(to_update, sorted(changed_fields | {'updated_at'}))
+    if to_create:
+        Question.objects.bulk_create(to_create)
+    if removed or to_update or to_create:
+        touch_form(form.pk, form.slug)
+
+
+def build_client_schema(form, version):
+    """Render the lightweight client-side schema for ``form`` (see FormViewSet.client_schema)."""
+    schema = {'id': str(form.id), 'version': version, 'title': form.title, 'description': form.description, 'questions': []}
+    for q in form.questions.all():
+        qschema = {
+            'id': str(q.id),
+            'type': q.question_type,
+            'label': q.question_text,
+            'required': q.is_required,
+            'order': q.order,
+            'placeholder': q.placeholder,
+            'help_text': q.help_text,
+            'hint': q.hint,
+        }
+        if q.options is not None:
+            qschema['options'] = q.options
+        # numeric constraints
+        if q.min_value is not None:
+            qschema['min_value'] = float(q.min_value)
+        if q.max_value is not None:
+            qschema['max_value'] = float(q.max_value)
+        # length constraints
+        if q.min_length is not None:
+            qschema['min_length'] = q.min_length
+        if q.max_length is not None:
+            qschema['max_length'] = q.max_length
+        schema['questions'].append(qschema)
+    return schema
@@ -0,0 +1,68 @@
+import contextlib
+import contextvars
+
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import client_schema_cache, form_detail_cache, form_version, version_for
+from .models import Form, Question
+
+_touch_deferred = contextvars.ContextVar('form_touch_deferred', default=False)
+
+
+def touch_form(form_id, slug=None):
+    """Bump ``Form.updated_at`` so caches keyed on the form version are refreshed."""
+    now = timezone.now()
+    Form.objects.filter(pk=form_id).update(updated_at=now)
+    invalidate_form_caches(form_id, slug, version_for(now))
+
+
+@contextlib.contextmanager
+def defer_form_touch():
+    """Skip the per-question ``touch_form`` inside the block; the caller touches the form once afterwards."""
+    token = _touch_deferred.set(True)
+    try:
+        yield
+    finally:
+        _touch_deferred.reset(token)
+
+
+def invalidate_form_caches(form_id, slug=None, version=None):
+    """Drop cached renderings of a form; ``version`` is its new version (None when it was deleted)."""
+    client_schema_cache.invalidate(form_id)
+    if slug is None:
+        slug = Form.objects.filter(pk=form_id).values_list('slug', flat=True).first()
+    if slug is not None:
+        form_detail_cache.invalidate(slug, version)
+
+
+@receiver(pre_save, sender=Form)
+def remember_slug(sender, instance, **kwargs):
+    instance._previous_slug = None
+    if not instance._state.adding:
+        instance._previous_slug = Form.objects.filter(pk=instance.pk).exclude(slug=instance.slug).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Form)
+def form_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'updated_at' not in update_fields:
+        # e.g. publish/unpublish: the stored version did not move, so bump it
+        touch_form(instance.pk, instance.slug)
+    else:
+        invalidate_form_caches(instance.pk, instance.slug, form_version(instance))
+    previous = getattr(instance, '_previous_slug', None)
+    if previous:
+        form_detail_cache.invalidate(previous)
+
+
+@receiver(post_delete, sender=Form)
+def form_deleted(sender, instance, **kwargs):
+    invalidate_form_caches(instance.pk, instance.slug)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, **kwargs):
+    if not _touch_deferred.get():
+        touch_form(instance.form_id)
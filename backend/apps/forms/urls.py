@@ -1,5 +1,6 @@
 ﻿from rest_framework.routers import DefaultRouter
 from .views import FormViewSet, QuestionViewSet
+from apps.submissions.views import SubmissionExportViewSet
 from django.urls import path, include
 
 router = DefaultRouter()
@@ -24,4 +25,7 @@ urlpatterns = [
     path('forms/<slug:form_slug>/questions/reorder/', QuestionViewSet.as_view({'patch': 'reorder'}), name='question-reorder'),
     path('forms/<slug:form_slug>/questions/<uuid:id>/validate/', QuestionViewSet.as_view({'post': 'validate_answer'}), name='question-validate'),
     path('forms/<slug:form_slug>/submissions/', include('apps.submissions.urls')),
+    path('forms/<slug:form_slug>/exports/', SubmissionExportViewSet.as_view({'get': 'list', 'post': 'create'}), name='export-list'),
+    path('forms/<slug:form_slug>/exports/<uuid:id>/', SubmissionExportViewSet.as_view({'get': 'retrieve'}), name='export-detail'),
+    path('forms/<slug:form_slug>/exports/<uuid:id>/download/', SubmissionExportViewSet.as_view({'get': 'download'}), name='export-download'),
 ]
@@ -0,0 +1,160 @@
+"""Compiled answer validation.
+
+A ``FormValidator`` is built once from all of a form's questions: option
+values are held as frozensets, date and number bounds are parsed up front and
+the email validator is shared. Validators are cached per form and keyed by
+``Form.updated_at`` (question changes touch the form, see ``signals.py``), so
+validating a submission costs one question lookup per request instead of one
+per answer.
+"""
+import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator
+
+from apps.core.cache import LRUCache
+
+
+CHOICE_TYPES = ('dropdown', 'radio', 'checkbox', 'multiselect')
+
+# Answer column holding the value for each question type; anything else is answer_text.
+ANSWER_FIELDS = {
+    'number': 'answer_number',
+    'date': 'answer_date',
+    'checkbox': 'answer_choices',
+    'multiselect': 'answer_choices',
+}
+
+_email_validator = EmailValidator()
+
+
+def answer_field(question_type):
+    """Return the Answer field carrying the value for ``question_type``."""
+    return ANSWER_FIELDS.get(question_type, 'answer_text')
+
+
+def _option_values(options):
+    values = [o['value'] if isinstance(o, dict) else o for o in options or []]
+    try:
+        return frozenset(values)
+    except TypeError:
+        # unhashable option values (e.g. nested lists) fall back to a linear scan
+        return tuple(values)
+
+
+def _contains(values, value):
+    try:
+        return value in values
+    except TypeError:
+        return False
+
+
+class CompiledQuestion:
+    """Pre-parsed validation rules for a single question."""
+
+    __slots__ = ('id', 'question_type', 'field', 'min_value', 'max_value', 'allow_past',
+                 'min_date', 'max_date', 'raw_min_date', 'raw_max_date', 'option_values')
+
+    def __init__(self, question):
+        qt = question.question_type
+        self.id = question.id
+        self.question_type = qt
+        self.field = answer_field(qt)
+        self.min_value = Decimal(str(question.min_value)) if question.min_value is not None else None
+        self.max_value = Decimal(str(question.max_value)) if question.max_value is not None else None
+        self.allow_past = True
+        self.min_date = self.max_date = None
+        self.raw_min_date = self.raw_max_date = None
+        self.option_values = None
+        if qt == 'date':
+            opts = question.options or {}
+            self.allow_past = opts.get('allow_past', True)
+            if opts.get('min_date'):
+                self.raw_min_date = opts['min_date']
+                self.min_date = datetime.date.fromisoformat(opts['min_date'])
+            if opts.get('max_date'):
+                self.raw_max_date = opts['max_date']
+                self.max_date = datetime.date.fromisoformat(opts['max_date'])
+        elif qt in CHOICE_TYPES:
+            self.option_values = _option_values(question.options)
+
+    def value_from(self, data):
+        """Pick this question's value out of an answer payload."""
+        return data.get(self.field)
+
+    def validate(self, value):
+        """Raise ValidationError if ``value`` is not an acceptable answer."""
+        qt = self.question_type
+        if qt == 'email':
+            try:
+                _email_validator(value)
+            except Exception as e:
+                raise ValidationError(f'Invalid email: {e}')
+
+        elif qt == 'number':
+            try:
+                num = Decimal(str(value))
+            except Exception:
+                raise ValidationError('Answer must be a number.')
+            if self.min_value is not None and num < self.min_value:
+                raise ValidationError(f'Number is below minimum of {self.min_value}.')
+            if self.max_value is not None and num > self.max_value:
+                raise ValidationError(f'Number is above maximum of {self.max_value}.')
+
+        elif qt == 'date':
+            try:
+                if isinstance(value, str):
+                    d = datetime.date.fromisoformat(value)
+                elif isinstance(value, datetime.date):
+                    d = value
+                else:
+                    raise ValueError()
+            except Exception:
+                raise ValidationError('Invalid date format, expected YYYY-MM-DD or date object.')
+            if not self.allow_past and d < datetime.date.today():
+                raise ValidationError('Past dates are not allowed for this question.')
+            if self.min_date is not None and d < self.min_date:
+                raise ValidationError(f'Date is before allowed minimum {self.raw_min_date}.')
+            if self.max_date is not None and d > self.max_date:
+                raise ValidationError(f'Date is after allowed maximum {self.raw_max_date}.')
+
+        elif qt in ('dropdown', 'radio'):
+            if not _contains(self.option_values, value):
+                raise ValidationError('Selected value is not a valid option.')
+
+        elif qt in ('checkbox', 'multiselect'):
+            # expect value to be a list of choices
+            if not isinstance(value, (list, tuple)):
+                raise ValidationError('Answer must be a list of selected options.')
+            for v in value:
+                if not _contains(self.option_values, v):
+                    raise ValidationError(f'Selected value {v} is not a valid option.')
+
+
+class FormValidator:
+    """All compiled questions of one form, indexed by question id."""
+
+    def __init__(self, questions):
+        self.questions = {q.id: CompiledQuestion(q) for q in questions}
+
+    def get(self, question_id):
+        return self.questions.get(question_id)
+
+
+_validators = LRUCache(maxsize=getattr(settings, 'FORM_VALIDATOR_CACHE_SIZE', 512))
+
+
+def get_form_validator(form):
+    """Return the cached FormValidator for ``form``, compiling it when the form changed."""
+    cached = _validators.get(form.pk)
+    if cached is not None and cached[0] == form.updated_at:
+        return cached[1]
+    validator = FormValidator(form.questions.all())
+    _validators.set(form.pk, (form.updated_at, validator))
+    return validator
+
+
+def forget_form_validator(form_id):
+    _validators.pop(form_id)
@@ -1,14 +1,23 @@
 ﻿from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Form, Question
-from .serializers import FormSerializer, QuestionSerializer
+from .models import Form, Question, unique_slug
+from .serializers import FormSerializer, FormSummarySerializer, QuestionSerializer, build_client_schema
+from .cache import client_schema_cache, form_detail_cache, form_version, version_for
+from .access import access_code_version, check_grant, grant_from_request, has_form_access, issue_grant, requires_grant
+from .validation import answer_field
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.text import slugify
+from django.conf import settings
 from apps.core.utils import get_client_ip
+from apps.core.pagination import KeysetPagination, PageNumberListPagination
+from apps.core.db import reads_from_replica
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from apps.analytics.aggregates import get_form_analytics
+from apps.submissions.export import iter_csv
 from django.http import StreamingHttpResponse
-import csv
-import io
 from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework.exceptions import ValidationError as DRFValidationError
 
@@ -22,85 +31,114 @@ class FormViewSet(viewsets.ModelViewSet):
     queryset = Form.objects.all()
     serializer_class = FormSerializer
     lookup_field = 'slug'
+    pagination_class = PageNumberListPagination
 
     def get_permissions(self):
-        if self.action in ['list', 'create']:
+        if self.action in ['list', 'create', 'instantiate']:
             return [permissions.IsAuthenticated()]
         if self.action in ['update', 'partial_update', 'destroy', 'update_settings', 'duplicate']:
             return [permissions.IsAuthenticated(), IsOwner()]
         return [permissions.AllowAny()]
 
     def get_queryset(self):
-        # list returns only user's forms
+        # list returns only user's forms, with submission counts annotated in the same query
         if self.action == 'list':
-            return Form.objects.filter(created_by=self.request.user)
+            return (Form.objects.filter(created_by=self.request.user)
+                    .annotate(submissions_count=Count('submissions', filter=Q(submissions__is_draft=False)),
+                              drafts_count=Count('submissions', filter=Q(submissions__is_draft=True)))
+                    .order_by('-created_at'))
         return super().get_queryset()
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return FormSummarySerializer
+        return super().get_serializer_class()
+
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
     def retrieve(self, request, slug=None):
-        form = get_object_or_404(Form, slug=slug)
+        # served from form_detail_cache: a hit needs at most a version read, the checks below run on the cached metadata
+        entry = form_detail_cache.lookup(slug, lambda: self._current_version(slug))
+        if entry is None:
+            form = get_object_or_404(Form.objects.select_related('created_by').prefetch_related('questions'), slug=slug)
+            entry = {
+                'expires_at': form.expires_at,
+                'is_published': form.is_published,
+                'owner_id': form.created_by_id,
+                'access_version': access_code_version(form.access_code) if requires_grant(form) else None,
+                'data': self.get_serializer(form).data,
+            }
+            form_detail_cache.store(slug, form_version(form), entry)
         # check expiry
-        if form.is_expired():
+        if entry['expires_at'] and timezone.now() > entry['expires_at']:
             return Response({'detail': 'Form expired.'}, status=status.HTTP_410_GONE)
         # check published state
-        if not form.is_published and form.created_by != request.user:
+        is_owner = entry['owner_id'] == request.user.pk
+        if not entry['is_published'] and not is_owner:
             return Response({'detail': 'Form not published.'}, status=status.HTTP_404_NOT_FOUND)
-        # password protection handled via verify-access endpoint
-        serializer = self.get_serializer(form)
-        return Response(serializer.data)
+        # password protection: a grant from verify-access, checked with an HMAC
+        if entry['access_version'] and not is_owner and not check_grant(grant_from_request(request), entry['data']['id'], entry['access_version']):
+            return Response({'detail': 'Access code required.'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(entry['data'])
+
+    @staticmethod
+    def _current_version(slug):
+        updated_at = Form.objects.filter(slug=slug).values_list('updated_at', flat=True).first()
+        return version_for(updated_at) if updated_at is not None else None
 
     @action(detail=True, methods=['get'], url_path='client-schema')
     def client_schema(self, request, slug=None):
         """Return a lightweight client-side JSON schema useful for rendering the form.
 
         The schema includes question id, type, label, required, options, help_text, hint, and constraints.
+        It is cached per form version; the version is returned in the payload and as an ETag so clients
+        can revalidate with If-None-Match and skip re-downloading an unchanged schema.
         """
         form = get_object_or_404(Form, slug=slug)
-        schema = {'id': str(form.id), 'title': form.title, 'description': form.description, 'questions': []}
-        for q in form.questions.all():
-            qschema = {
-                'id': str(q.id),
-                'type': q.question_type,
-                'label': q.question_text,
-                'required': q.is_required,
-                'order': q.order,
-                'placeholder': q.placeholder,
-                'help_text': q.help_text,
-                'hint': q.hint,
-            }
-            if q.options is not None:
-                qschema['options'] = q.options
-            # numeric constraints
-            if q.min_value is not None:
-                qschema['min_value'] = float(q.min_value)
-            if q.max_value is not None:
-                qschema['max_value'] = float(q.max_value)
-            # length constraints
-            if q.min_length is not None:
-                qschema['min_length'] = q.min_length
-            if q.max_length is not None:
-                qschema['max_length'] = q.max_length
-            schema['questions'].append(qschema)
-        return Response(schema)
+        if not has_form_access(request, form):
+            return Response({'detail': 'Access code required.'}, status=status.HTTP_403_FORBIDDEN)
+        version = form_version(form)
+        etag = f'"{version}"'
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        schema = client_schema_cache.get_or_set(form.pk, version, lambda: build_client_schema(form, version))
+        return Response(schema, headers=headers)
 
     @action(detail=True, methods=['post'])
     def duplicate(self, request, slug=None):
+        """Copy a form and its questions (owner-only). The copy gets a free ``<slug>-copy[-N]`` slug."""
         form = get_object_or_404(Form, slug=slug)
-        # require authenticated
-        if not request.user.is_authenticated:
-            return Response({'detail': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
-        # copy the form
-        data = FormSerializer(form).data
-        data['title'] = data['title'] + ' (copy)'
-        data.pop('id', None)
-        data.pop('created_at', None)
-        data.pop('updated_at', None)
-        data['slug'] = data.get('slug') + '-copy'
-        serializer = FormSerializer(data=data, context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        new_form = serializer.save()
+        self.check_object_permissions(request, form)
+        new_form = form.clone(request.user, title=f'{form.title} (copy)')
+        return Response(FormSerializer(new_form).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def instantiate(self, request, slug=None):
+        """Create a new form for the current user from a template (``is_template=True``).
+
+        Optional body: ``title`` and ``slug``; the slug is slugified and defaults to a free one derived from the title.
+        """
+        template = get_object_or_404(Form, slug=slug, is_template=True)
+        if not template.is_published and template.created_by != request.user:
+            return Response({'detail': 'Template not found.'}, status=status.HTTP_404_NOT_FOUND)
+        title = request.data.get('title') or template.title
+        new_slug = request.data.get('slug')
+        if new_slug:
+            try:
+                new_slug = Form._meta.get_field('slug').clean(slugify(str(new_slug)), None)
+            except DjangoValidationError as e:
+                return Response({'slug': e.messages}, status=status.HTTP_400_BAD_REQUEST)
+        taken = Response({'slug': ['A form with this slug already exists.']}, status=status.HTTP_400_BAD_REQUEST)
+        if new_slug and Form.objects.filter(slug=new_slug).exists():
+            return taken
+        try:
+            with transaction.atomic():
+                new_form = template.clone(request.user, title=title, slug=new_slug or unique_slug(title), is_template=False)
+        except IntegrityError:
+            # lost a race for the slug with a concurrent request
+            return taken
         return Response(FormSerializer(new_form).data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'], url_path='publish')
@@ -125,13 +163,18 @@ class FormViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def verify_access(self, request, slug=None):
+        """Check the access code once and return a signed grant for the form.
+
+        Send the grant as the ``X-Form-Access`` header (or ``?access_token=``) when retrieving the form, its
+        client schema or creating submissions; it is valid for ``expires_in`` seconds or until the code changes.
+        """
         form = get_object_or_404(Form, slug=slug)
         if not form.is_password_protected:
             return Response({'detail': 'Form is not password protected.'}, status=status.HTTP_400_BAD_REQUEST)
         code = request.data.get('code')
         if not form.check_access_code(code):
             return Response({'detail': 'Invalid access code.'}, status=status.HTTP_403_FORBIDDEN)
-        return Response({'detail': 'Access granted.'})
+        return Response({'detail': 'Access granted.', 'access_token': issue_grant(form), 'expires_in': settings.FORM_ACCESS_GRANT_TTL})
 
     @action(detail=True, methods=['get'])
     def check_access(self, request, slug=None):
@@ -147,32 +190,31 @@ class FormViewSet(viewsets.ModelViewSet):
     def ratelimit_status(self, request, slug=None):
         form = get_object_or_404(Form, slug=slug)
         ip = request.query_params.get('ip') or get_client_ip(request)
-        from apps.ratelimit.models import SubmissionRateLimit
-        try:
-            rl = SubmissionRateLimit.objects.get(form=form, ip_address=ip)
-            return Response({'ip': ip, 'submission_count': rl.submission_count, 'first_submission_at': rl.first_submission_at, 'last_submission_at': rl.last_submission_at, 'is_blocked': rl.is_blocked, 'blocked_until': rl.blocked_until})
-        except SubmissionRateLimit.DoesNotExist:
-            return Response({'ip': ip, 'submission_count': 0})
+        from apps.ratelimit.limiter import peek_form
+        result = peek_form(form, ip)
+        return Response({'ip': ip, 'submission_count': result.count, 'limit': result.limit, 'remaining': result.remaining, 'reset_after': result.reset_after, 'is_blocked': form.rate_limit_enabled and not result.allowed})
 
     @action(detail=True, methods=['get'], url_path='submissions/report')
+    @reads_from_replica
     def submissions_report(self, request, slug=None):
-        """Return paginated submissions for a form (owner-only)."""
+        """Return paginated submissions for a form (owner-only).
+
+        Newest first, paginated by cursor (``?cursor=...&page_size=...``; follow ``next``/``previous``), so
+        every page costs one index range scan. ``count`` is the form's maintained accepted-submission counter.
+        """
         form = get_object_or_404(Form, slug=slug)
         if form.created_by != request.user:
             return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
-        qs = form.submissions.filter(is_draft=False).order_by('-submitted_at')
-        # simple pagination
-        page = int(request.query_params.get('page', 1))
-        page_size = int(request.query_params.get('page_size', 25))
-        start = (page - 1) * page_size
-        end = start + page_size
-        items = qs[start:end]
+        qs = form.submissions.filter(is_draft=False).select_related('submitted_by')
+        paginator = KeysetPagination()
+        items = paginator.paginate_queryset(qs, request, view=self)
         data = []
         for s in items:
             data.append({'id': str(s.id), 'submitted_by': str(s.submitted_by) if s.submitted_by else None, 'submitted_at': s.submitted_at, 'ip_address': s.ip_address})
-        return Response({'count': qs.count(), 'page': page, 'page_size': page_size, 'results': data})
+        return paginator.get_paginated_response(data, count=form.accepted_submissions)
 
     @action(detail=True, methods=['get'], url_path='analytics')
+    @reads_from_replica
     def analytics(self, request, slug=None):
         """Return lightweight analytics for the form (owner-only).
 
@@ -181,74 +223,30 @@ class FormViewSet(viewsets.ModelViewSet):
         - submissions_last_24h: count
         - avg_completion_seconds: average time from creation -> completed (if available)
         - question_stats: per-question simple stats (counts, choice distribution where applicable)
+
+        Values are read from the aggregates maintained at submission time, or computed with a fixed number of
+        grouped queries when ANALYTICS_MODE is 'query' (see apps.analytics).
         """
         form = get_object_or_404(Form, slug=slug)
         if form.created_by != request.user:
             return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
 
-        qs = form.submissions.filter(is_draft=False)
-        total = qs.count()
-        now = timezone.now()
-        last_24 = qs.filter(submitted_at__gte=now - timezone.timedelta(hours=24)).count()
-
-        # average completion time (completed_at - created_at) in seconds
-        times = []
-        for s in qs.exclude(completed_at__isnull=True):
-            if s.submitted_at and s.created_at:
-                diff = (s.completed_at - s.created_at).total_seconds()
-                times.append(diff)
-        avg_completion = sum(times) / len(times) if times else None
-
-        question_stats = []
-        for q in form.questions.all():
-            stat = {'id': str(q.id), 'question_text': q.question_text, 'type': q.question_type, 'responses': 0}
-            answers = q.answers.filter(submission__is_draft=False)
-            stat['responses'] = answers.count()
-            if q.question_type in ('dropdown', 'radio', 'checkbox', 'multiselect') and q.options:
-                # q.options is JSON list of option strings; count occurrences
-                counts = {}
-                for a in answers:
-                    # answer stored in answer_text or answer_choices depending on type
-                    if a.answer_text:
-                        val = a.answer_text
-                        counts[val] = counts.get(val, 0) + 1
-                    elif a.answer_choices:
-                        # assume a.answer_choices is stored as list-like (JSONField)
-                        for choice in a.answer_choices:
-                            counts[choice] = counts.get(choice, 0) + 1
-                stat['choices'] = counts
-            question_stats.append(stat)
-
-        return Response({
-            'total_submissions': total,
-            'submissions_last_24h': last_24,
-            'avg_completion_seconds': avg_completion,
-            'question_stats': question_stats,
-        })
+        return Response(get_form_analytics(form))
 
     @action(detail=True, methods=['get'], url_path='submissions/export')
+    @reads_from_replica
     def submissions_export(self, request, slug=None):
-        """Stream CSV export of submissions (owner-only)."""
+        """Stream CSV export of submissions (owner-only).
+
+        One row per submission and one column per question (in question order). Rows are produced in
+        keyset-paginated batches so memory use stays constant regardless of the number of submissions.
+        """
         form = get_object_or_404(Form, slug=slug)
         if form.created_by != request.user:
             return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
-        qs = form.submissions.filter(is_draft=False).order_by('submitted_at')
-
-        def row_generator():
-            buf = io.StringIO()
-            writer = csv.writer(buf)
-            # header
-            writer.writerow(['submission_id', 'submitted_by', 'submitted_at', 'ip_address'])
-            yield buf.getvalue()
-            buf.seek(0)
-            buf.truncate(0)
-            for s in qs:
-                writer.writerow([str(s.id), str(s.submitted_by) if s.submitted_by else '', s.submitted_at.isoformat() if s.submitted_at else '', s.ip_address or ''])
-                yield buf.getvalue()
-                buf.seek(0)
-                buf.truncate(0)
-
-        return StreamingHttpResponse(row_generator(), content_type='text/csv')
+        response = StreamingHttpResponse(iter_csv(form), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{form.slug}-submissions.csv"'
+        return response
 
     @action(detail=True, methods=['post'], url_path='ratelimit/reset')
     def ratelimit_reset(self, request, slug=None):
@@ -257,7 +255,10 @@ class FormViewSet(viewsets.ModelViewSet):
         if form.created_by != request.user:
             return Response({'detail': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
         ip = request.data.get('ip')
+        from apps.ratelimit.limiter import reset_form
         from apps.ratelimit.models import SubmissionRateLimit
+        reset_form(form, ip)
+        # also clear the optional audit trail
         qs = SubmissionRateLimit.objects.filter(form=form)
         if ip:
             qs = qs.filter(ip_address=ip)
@@ -303,15 +304,9 @@ class QuestionViewSet(viewsets.ModelViewSet):
         order = request.data.get('order', [])
         if not isinstance(order, list):
             return Response({'detail': 'Order must be a list of question IDs'}, status=status.HTTP_400_BAD_REQUEST)
-        # validate
-        ids = [str(q.id) for q in form.questions.all()]
-        if set(ids) != set([str(i) for i in order]):
+        # validated and applied with a constant number of statements, then the cached schema is invalidated
+        if not form.reorder_questions(order):
             return Response({'detail': 'IDs mismatch'}, status=status.HTTP_400_BAD_REQUEST)
-        # apply new order
-        for idx, qid in enumerate(order, start=1):
-            q = form.questions.get(id=qid)
-            q.order = idx
-            q.save()
         return Response({'detail': 'Reordered'})
 
     @action(detail=True, methods=['post'], url_path='validate')
@@ -329,19 +324,7 @@ class QuestionViewSet(viewsets.ModelViewSet):
         # pick the value out of request.data according to question type
         payload = request.data
         try:
-            if question.question_type in ('text', 'textarea', 'email'):
-                val = payload.get('answer_text')
-            elif question.question_type == 'number':
-                val = payload.get('answer_number')
-            elif question.question_type == 'date':
-                val = payload.get('answer_date')
-            elif question.question_type in ('dropdown', 'radio'):
-                val = payload.get('answer_text')
-            elif question.question_type in ('checkbox', 'multiselect'):
-                val = payload.get('answer_choices')
-            else:
-                val = payload.get('answer_text')
-
+            val = payload.get(answer_field(question.question_type))
             question.validate_answer(val)
         except DjangoValidationError as e:
             raise DRFValidationError(e.message_dict if hasattr(e, 'message_dict') else e.messages)
@@ -1,15 +1,21 @@
 ﻿from django.contrib import admin
-from .models import FormNotificationLog
+from .models import FormNotificationLog, PendingNotification
 from apps.ratelimit.models import SubmissionRateLimit
 
 
 @admin.register(FormNotificationLog)
 class FormNotificationLogAdmin(admin.ModelAdmin):
-    list_display = ('to_email', 'form', 'submission', 'sent_at', 'success')
-    list_filter = ('success', 'form', 'sent_at')
+    list_display = ('to_email', 'form', 'submission', 'is_digest', 'submission_count', 'sent_at', 'success')
+    list_filter = ('success', 'is_digest', 'form', 'sent_at')
     search_fields = ('to_email', 'message')
 
 
+@admin.register(PendingNotification)
+class PendingNotificationAdmin(admin.ModelAdmin):
+    list_display = ('form', 'submission', 'created_at')
+    list_filter = ('form',)
+
+
 @admin.register(SubmissionRateLimit)
 class SubmissionRateLimitAdmin(admin.ModelAdmin):
     list_display = ('form', 'ip_address', 'submission_count', 'first_submission_at', 'last_submission_at', 'is_blocked', 'blocked_until')
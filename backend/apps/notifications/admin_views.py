@@ -1,10 +1,16 @@
-﻿from rest_framework import viewsets, permissions
+﻿from rest_framework import viewsets, permissions, renderers
+from rest_framework.views import APIView
 from .serializers import NotificationLogSerializer
 from .models import FormNotificationLog
 from apps.ratelimit.models import SubmissionRateLimit
+from apps.ratelimit.limiter import get_rate_limiter, reset_form
+from apps.forms.models import Form
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from apps.core.db import reads_from_replica
+from apps.core.metrics import registry, render_prometheus
+from apps.forms.cache import TwoTierCache
 
 
 class IsStaff(permissions.BasePermission):
@@ -17,14 +23,19 @@ class NotificationLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationLogSerializer
     permission_classes = [IsStaff]
 
+    @reads_from_replica
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class RateLimitAdminViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = SubmissionRateLimit.objects.all().order_by('-last_submission_at')
     permission_classes = [IsStaff]
 
+    @reads_from_replica
     def list(self, request):
         qs = self.get_queryset()
-        data = [{'form': str(r.form.id), 'ip_address': r.ip_address, 'submission_count': r.submission_count, 'last_submission_at': r.last_submission_at} for r in qs]
+        data = [{'form': str(r.form_id), 'ip_address': r.ip_address, 'submission_count': r.submission_count, 'last_submission_at': r.last_submission_at} for r in qs]
         return Response(data)
 
     @action(detail=False, methods=['post'], url_path='reset')
@@ -32,6 +43,12 @@ class RateLimitAdminViewSet(viewsets.ReadOnlyModelViewSet):
         # admin endpoint to reset rate limits optionally by form or ip
         form_id = request.data.get('form')
         ip = request.data.get('ip')
+        if form_id:
+            form = get_object_or_404(Form, id=form_id)
+            reset_form(form, ip)
+        else:
+            # without a form: the ip's hits on every form, or everything when no ip is given
+            get_rate_limiter().reset(ident=ip)
         qs = SubmissionRateLimit.objects.all()
         if form_id:
             qs = qs.filter(form__id=form_id)
@@ -39,3 +56,40 @@ class RateLimitAdminViewSet(viewsets.ReadOnlyModelViewSet):
             qs = qs.filter(ip_address=ip)
         deleted = qs.delete()
         return Response({'deleted': deleted[0]})
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = renderer_context and renderer_context.get('response')
+        if response is not None and response.status_code >= 400:
+            return str(data.get('detail', '')) if isinstance(data, dict) else str(data)
+        return render_prometheus(data)
+
+
+class MetricsView(APIView):
+    """Per-endpoint request metrics collected by ProfilingMiddleware (this process only).
+
+    JSON by default; ``?format=prometheus`` (or ``Accept: text/plain``) returns the Prometheus text format.
+    DELETE clears the collected metrics.
+    """
+    permission_classes = [IsStaff]
+    renderer_classes = [renderers.JSONRenderer, PrometheusRenderer]
+
+    def get(self, request):
+        return Response(registry.snapshot())
+
+    def delete(self, request):
+        registry.reset()
+        return Response(status=204)
+
+
+class CacheStatsView(APIView):
+    """Hit/miss counters and local sizes of the form caches (this process only)."""
+    permission_classes = [IsStaff]
+
+    def get(self, request):
+        return Response({cache.name: cache.snapshot() for cache in TwoTierCache.instances})
@@ -0,0 +1,76 @@
+"""Digest notifications.
+
+Forms in ``digest`` mode do not mail each submission. Accepted submissions are
+queued as ``PendingNotification`` rows inside the request transaction, and a
+periodic job (the ``send_notification_digests`` task or management command)
+sends one summary per form once ``digest_interval_minutes`` have passed since
+the oldest queued submission or ``digest_max_submissions`` have piled up. The
+summary is written to the outbox in the transaction that claims the rows, so a
+failed send is retried by the outbox drain instead of being lost.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import PendingNotification
+
+DIGEST_LISTED_SUBMISSIONS = 50
+
+
+def queue_submissions(form, submissions):
+    """Queue accepted ``submissions`` of ``form`` for its next digest (one insert)."""
+    PendingNotification.objects.bulk_create([PendingNotification(form=form, submission=s) for s in submissions], ignore_conflicts=True)
+
+
+def due_forms(now=None):
+    """Forms whose queued notifications should be sent now, read with one grouped query."""
+    from apps.forms.models import Form
+
+    now = now or timezone.now()
+    pending = {row['form_id']: row for row in PendingNotification.objects.values('form_id').annotate(n=Count('id'), oldest=Min('created_at'))}
+    forms = Form.objects.in_bulk(list(pending))
+    due = []
+    for form_id, row in pending.items():
+        form = forms[form_id]
+        if row['n'] >= form.digest_max_submissions or row['oldest'] <= now - datetime.timedelta(minutes=form.digest_interval_minutes):
+            due.append(form)
+    return due
+
+
+def build_digest(form, submissions):
+    count = len(submissions)
+    subject = f'{count} new submission{"s" if count != 1 else ""} for {form.title}'
+    lines = [f'{count} new submission{"s were" if count != 1 else " was"} received for {form.title}:', '']
+    lines += [f'- {submitted_at:%Y-%m-%d %H:%M} UTC ({submission_id})' for submission_id, submitted_at in submissions[:DIGEST_LISTED_SUBMISSIONS]]
+    if count > DIGEST_LISTED_SUBMISSIONS:
+        lines.append(f'... and {count - DIGEST_LISTED_SUBMISSIONS} more.')
+    return subject, '\n'.join(lines)
+
+
+def send_form_digest(form):
+    """Claim everything queued for ``form`` and enqueue one digest for its recipients.
+
+    Returns the number of submissions covered. The rows are deleted in the transaction that writes the
+    outbox message, so concurrent runs never cover the same submission twice and the digest is only
+    dropped together with its delivery.
+    """
+    from apps.outbox.outbox import enqueue
+    from .tasks import DIGEST_TOPIC
+
+    with transaction.atomic():
+        claimed = list(PendingNotification.objects.select_for_update().filter(form=form)
+                       .order_by('created_at').values_list('id', 'submission_id', 'submission__submitted_at'))
+        PendingNotification.objects.filter(id__in=[row[0] for row in claimed]).delete()
+        if not claimed or not (form.enable_email_notifications and form.notification_emails):
+            return 0
+        subject, body = build_digest(form, [row[1:] for row in claimed])
+        enqueue(DIGEST_TOPIC, {'form_id': str(form.id), 'subject': subject, 'body': body,
+                               'recipients': list(form.notification_emails), 'submission_count': len(claimed)})
+    return len(claimed)
+
+
+def send_notification_digests(now=None):
+    """Enqueue the digests that are due; returns ``{form slug: submissions covered}``."""
+    return {form.slug: send_form_digest(form) for form in due_forms(now)}
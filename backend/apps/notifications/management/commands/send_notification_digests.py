@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from apps.notifications.digest import send_notification_digests
+
+
+class Command(BaseCommand):
+    help = 'Queue the digest emails that are due for forms in digest notification mode (run from cron without Celery beat).'
+
+    def handle(self, *args, **options):
+        sent = send_notification_digests()
+        for slug, count in sent.items():
+            self.stdout.write(f'{slug}: {count} submission(s)')
+        self.stdout.write(self.style.SUCCESS(f'Queued digests for {len(sent)} form(s).'))
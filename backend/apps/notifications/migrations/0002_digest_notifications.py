@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms', '0006_form_notification_mode'),
+        ('notifications', '0001_initial'),
+        ('submissions', '0004_submission_cursor_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formnotificationlog',
+            name='is_digest',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='formnotificationlog',
+            name='submission_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='formnotificationlog',
+            name='submission',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notification_logs', to='submissions.formsubmission'),
+        ),
+        migrations.CreateModel(
+            name='PendingNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_notifications', to='forms.form')),
+                ('submission', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pending_notification', to='submissions.formsubmission')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['form', 'created_at'], name='notificatio_form_id_a8196e_idx')],
+            },
+        ),
+    ]
@@ -5,7 +5,10 @@ from django.db import models
 class FormNotificationLog(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     form = models.ForeignKey('forms.Form', on_delete=models.CASCADE, related_name='notification_logs')
-    submission = models.ForeignKey('submissions.FormSubmission', on_delete=models.CASCADE, related_name='notification_logs')
+    # null for digest entries, which cover submission_count submissions
+    submission = models.ForeignKey('submissions.FormSubmission', on_delete=models.CASCADE, related_name='notification_logs', null=True, blank=True)
+    is_digest = models.BooleanField(default=False)
+    submission_count = models.PositiveIntegerField(default=1)
     to_email = models.EmailField()
     sent_at = models.DateTimeField(auto_now_add=True)
     success = models.BooleanField(default=True)
@@ -13,3 +16,16 @@ class FormNotificationLog(models.Model):
 
     def __str__(self):
         return f"Notification to {self.to_email} for {self.form}"
+
+
+class PendingNotification(models.Model):
+    """A submission waiting to be included in its form's next digest email."""
+    form = models.ForeignKey('forms.Form', on_delete=models.CASCADE, related_name='pending_notifications')
+    submission = models.OneToOneField('submissions.FormSubmission', on_delete=models.CASCADE, related_name='pending_notification')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['form', 'created_at'])]
+
+    def __str__(self):
+        return f"Pending notification for {self.submission_id}"
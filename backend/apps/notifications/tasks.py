@@ -1,53 +1,104 @@
 ﻿"""Notification dispatch utilities.
 
-Prefer Celery-backed tasks if Celery is installed and configured. Fall back
-to an in-process ThreadPoolExecutor for development/testing environments where
-Celery/Redis may not be available.
+Notifications are written to the transactional outbox (``apps.outbox``) in the
+transaction that accepts the submission, one message per submission, and
+delivered by the outbox drain: every recipient is mailed over a single mail
+connection and the outcomes are logged with one bulk insert. Forms in digest
+mode queue submissions instead (see ``digest``); with Celery installed the
+digests are flushed by a periodic task and delivered through the outbox too.
 """
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
+from apps.outbox.outbox import enqueue_many, handler
 from .models import FormNotificationLog
 
+SUBMISSION_TOPIC = 'notifications.submission'
+DIGEST_TOPIC = 'notifications.digest'
 
-try:  # pragma: no cover - optional dependency
-    from celery import shared_task
 
-    @shared_task(bind=True, acks_late=True)
-    def send_notification_email(self, form_id, submission_id, subject, body, to_email):
-        from apps.forms.models import Form
-        from apps.submissions.models import FormSubmission
+def deliver_notifications(form, submission, subject, body, recipients, **log_fields):
+    """Send one message per recipient over a shared connection and log every outcome.
 
+    Returns ``{recipient: error}`` for the recipients that could not be sent to. ``log_fields`` are
+    stored on every log entry (digests set ``is_digest`` and ``submission_count``).
+    """
+    failed = {}
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        failed = {to: str(e) for to in recipients}
+    else:
         try:
-            form = Form.objects.get(id=form_id)
-            submission = FormSubmission.objects.get(id=submission_id)
-        except Exception as e:
-            FormNotificationLog.objects.create(form_id=form_id, submission_id=submission_id, to_email=to_email, success=False, message=str(e))
-            return {'status': 'missing', 'error': str(e)}
+            for to in recipients:
+                try:
+                    connection.send_messages([EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [to], connection=connection)])
+                except Exception as e:
+                    failed[to] = str(e)
+        finally:
+            connection.close()
+    FormNotificationLog.objects.bulk_create([
+        FormNotificationLog(form=form, submission=submission, to_email=to, success=to not in failed, message=failed.get(to, ''), **log_fields)
+        for to in recipients
+    ])
+    return failed
 
-        try:
-            send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [to_email])
-            FormNotificationLog.objects.create(form=form, submission=submission, to_email=to_email, success=True)
-            return {'status': 'sent'}
-        except Exception as e:
-            FormNotificationLog.objects.create(form=form, submission=submission, to_email=to_email, success=False, message=str(e))
-            raise
 
-    def dispatch_notification(form, submission, subject, body, to_email):
-        send_notification_email.delay(str(form.id), str(submission.id), subject, body, to_email)
+def notify_submissions(form, submissions, subject, body):
+    """Notify ``form``'s recipients of newly accepted ``submissions``; call inside the accepting transaction.
 
-except Exception:  # Celery not available — fallback
-    from concurrent.futures import ThreadPoolExecutor
+    Digest-mode forms queue the submissions for the next digest; otherwise one outbox message per
+    submission is written, so the notification commits (or rolls back) with the submission.
+    """
+    if not (form.enable_email_notifications and form.notification_emails) or not submissions:
+        return
+    if form.notification_mode == 'digest':
+        from .digest import queue_submissions
+        queue_submissions(form, submissions)
+        return
+    enqueue_many(SUBMISSION_TOPIC, [
+        {'form_id': str(form.id), 'submission_id': str(s.id), 'subject': subject, 'body': body, 'recipients': list(form.notification_emails)}
+        for s in submissions
+    ])
 
-    _executor = ThreadPoolExecutor(max_workers=4)
 
+@handler(SUBMISSION_TOPIC)
+def send_submission_notifications(payload):
+    from apps.forms.models import Form
+    from apps.submissions.models import FormSubmission
 
-    def _send_and_log(form, submission, subject, body, to_email):
-        try:
-            send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [to_email])
-            FormNotificationLog.objects.create(form=form, submission=submission, to_email=to_email, success=True)
-        except Exception as e:
-            FormNotificationLog.objects.create(form=form, submission=submission, to_email=to_email, success=False, message=str(e))
+    form = Form.objects.filter(id=payload['form_id']).first()
+    submission = FormSubmission.objects.filter(id=payload['submission_id']).first()
+    if form is None or submission is None:
+        return  # deleted since it was accepted; nothing to announce
+    failed = deliver_notifications(form, submission, payload['subject'], payload['body'], payload['recipients'])
+    if failed:
+        # retry only the recipients that failed
+        payload['recipients'] = list(failed)
+        raise RuntimeError(f'Delivery failed for {", ".join(failed)}')
+
+
+@handler(DIGEST_TOPIC)
+def send_digest(payload):
+    from apps.forms.models import Form
+
+    form = Form.objects.filter(id=payload['form_id']).first()
+    if form is None:
+        return
+    failed = deliver_notifications(form, None, payload['subject'], payload['body'], payload['recipients'],
+                                   is_digest=True, submission_count=payload['submission_count'])
+    if failed:
+        payload['recipients'] = list(failed)
+        raise RuntimeError(f'Delivery failed for {", ".join(failed)}')
+
+
+try:  # pragma: no cover - optional dependency
+    from celery import shared_task
 
+    @shared_task
+    def send_notification_digests():
+        from .digest import send_notification_digests as send_digests
+        return send_digests()
 
-    def dispatch_notification(form, submission, subject, body, to_email):
-        _executor.submit(_send_and_log, form, submission, subject, body, to_email)
+except Exception:  # Celery not available — run the send_notification_digests command from cron
+    send_notification_digests = None
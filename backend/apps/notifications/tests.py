@@ -0,0 +1,164 @@
+import datetime
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.core.metrics import registry
+from apps.forms.models import Form, Question
+from apps.outbox.models import OutboxMessage
+from apps.outbox.outbox import drain
+from apps.submissions.models import FormSubmission
+from .digest import send_form_digest, send_notification_digests
+from .models import FormNotificationLog, PendingNotification
+from .tasks import deliver_notifications, notify_submissions
+
+User = get_user_model()
+
+
+class FlakyBackend(EmailBackend):
+    """locmem backend that refuses one address and counts opened connections."""
+    opened = 0
+
+    def open(self):
+        FlakyBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any('bounce@example.com' in m.to for m in messages):
+            raise OSError('mailbox unavailable')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='apps.notifications.tests.FlakyBackend')
+class NotificationDeliveryTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.form = Form.objects.create(title='T', created_by=user, slug='t-form', enable_email_notifications=True,
+                                        notification_emails=['a@example.com', 'bounce@example.com', 'b@example.com'])
+        self.submission = FormSubmission.objects.create(form=self.form, is_draft=False)
+        FlakyBackend.opened = 0
+
+    def test_one_connection_and_bulk_log(self):
+        with self.assertNumQueries(1):
+            failed = deliver_notifications(self.form, self.submission, 'Subj', 'Body', self.form.notification_emails)
+        self.assertEqual(list(failed), ['bounce@example.com'])
+        self.assertEqual(FlakyBackend.opened, 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['a@example.com', 'b@example.com'])
+        logs = dict(FormNotificationLog.objects.values_list('to_email', 'success'))
+        self.assertEqual(logs, {'a@example.com': True, 'bounce@example.com': False, 'b@example.com': True})
+
+    def test_outbox_retries_only_failed_recipients(self):
+        with transaction.atomic():
+            notify_submissions(self.form, [self.submission], 'Subj', 'Body')
+        with self.assertLogs('apps.outbox.outbox', 'ERROR'):
+            self.assertEqual(drain(max_workers=1), 1)
+        self.assertEqual(len(mail.outbox), 2)
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertEqual(message.payload['recipients'], ['bounce@example.com'])
+        # not due again until the backoff has passed
+        self.assertEqual(drain(max_workers=1), 0)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class DigestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.form = Form.objects.create(title='Hot', created_by=user, slug='hot', enable_email_notifications=True, rate_limit_enabled=False,
+                                        notification_emails=['a@example.com', 'b@example.com'], notification_mode='digest',
+                                        digest_interval_minutes=15, digest_max_submissions=3)
+        self.q = Question.objects.create(form=self.form, question_text='Name', question_type='text', order=1)
+
+    def submit(self, n):
+        for i in range(n):
+            data = {'is_draft': False, 'answers': [{'question': str(self.q.id), 'answer_text': f'v{i}'}]}
+            resp = self.client.post(f'/api/forms/{self.form.slug}/submissions/', data=json.dumps(data), content_type='application/json')
+            self.assertEqual(resp.status_code, 201)
+
+    def test_digest_by_count_and_interval(self):
+        self.submit(2)
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(PendingNotification.objects.count(), 2)
+        # neither threshold reached yet
+        self.assertEqual(send_notification_digests(), {})
+        self.submit(1)
+        call_command('send_notification_digests', stdout=mock.MagicMock())
+        self.assertEqual(OutboxMessage.objects.get().topic, 'notifications.digest')
+        self.assertEqual(drain(max_workers=1), 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertTrue(mail.outbox[0].subject.startswith('3 new submissions'))
+        logs = FormNotificationLog.objects.all()
+        self.assertEqual([(l.is_digest, l.submission_count, l.submission_id) for l in logs], [(True, 3, None)] * 2)
+        self.assertFalse(PendingNotification.objects.exists())
+
+        self.submit(1)
+        later = timezone.now() + datetime.timedelta(minutes=16)
+        self.assertEqual(send_notification_digests(now=later), {'hot': 1})
+        self.assertEqual(drain(max_workers=1), 1)
+        self.assertEqual(len(mail.outbox), 4)
+
+    @override_settings(EMAIL_BACKEND='apps.notifications.tests.FlakyBackend')
+    def test_failed_digest_is_retried(self):
+        self.form.notification_emails = ['a@example.com', 'bounce@example.com']
+        self.form.save()
+        self.submit(2)
+        self.assertEqual(send_form_digest(self.form), 2)
+        with self.assertLogs('apps.outbox.outbox', 'ERROR'):
+            drain(max_workers=1)
+        # the claimed rows are gone, but the digest for the failed recipient is still pending
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.payload['recipients']), ('pending', ['bounce@example.com']))
+        self.assertEqual(message.payload['submission_count'], 2)
+
+    def test_immediate_mode_writes_outbox_in_transaction(self):
+        self.form.notification_mode = 'immediate'
+        self.form.save()
+        self.submit(1)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.topic, 'notifications.submission')
+        self.assertEqual(message.payload['recipients'], ['a@example.com', 'b@example.com'])
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0)
+class MetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.staff = User.objects.create_user(username='staff', email='staff@example.com', password='pw', is_staff=True)
+        self.form = Form.objects.create(title='T', created_by=self.owner, slug='t-form')
+
+    def test_endpoint_metrics(self):
+        self.client.force_authenticate(user=self.owner)
+        for _ in range(3):
+            self.assertEqual(self.client.get(f'/api/forms/{self.form.slug}/analytics/').status_code, 200)
+        resp = self.client.get(f'/api/forms/{self.form.slug}/submissions/export/')
+        b''.join(resp.streaming_content)
+        self.assertEqual(self.client.get('/api/admin/metrics/').status_code, 403)
+
+        self.client.force_authenticate(user=self.staff)
+        data = self.client.get('/api/admin/metrics/').json()
+        analytics = data['FormViewSet.analytics']
+        self.assertEqual((analytics['requests'], analytics['status']), (3, {'2xx': 3}))
+        self.assertEqual(analytics['db_queries']['count'], 3)
+        self.assertGreater(analytics['db_queries']['sum'], 0)
+        self.assertGreater(analytics['response_bytes']['max'], 0)
+        # streamed responses are measured once fully consumed, including the queries made while streaming
+        export = data['FormViewSet.submissions_export']
+        self.assertGreater(export['db_queries']['max'], 0)
+
+        text = self.client.get('/api/admin/metrics/?format=prometheus').content.decode()
+        self.assertIn('form_maker_http_requests_total{endpoint="FormViewSet.analytics",status="2xx"} 3', text)
+        self.assertIn('form_maker_http_wall_seconds_count{endpoint="FormViewSet.analytics"} 3', text)
+        with override_settings(PROFILING_ENABLED=False):
+            self.client.get(f'/api/forms/{self.form.slug}/analytics/')
+        self.assertEqual(self.client.get('/api/admin/metrics/').json()['FormViewSet.analytics']['requests'], 3)
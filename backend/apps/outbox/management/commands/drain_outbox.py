@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.outbox.outbox import drain
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending outbox messages (notifications, export jobs). Runs once, or keeps polling with --loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep draining, sleeping --interval seconds when idle')
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--workers', type=int, default=None, help='Maximum handlers running concurrently')
+
+    def handle(self, *args, **options):
+        while True:
+            handled = drain(batch_size=options['batch_size'], max_workers=options['workers'])
+            if handled:
+                self.stdout.write(f'Handled {handled} message(s).')
+            if not options['loop']:
+                break
+            if not handled:
+                time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+import uuid
+
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxMessage(models.Model):
+    """A side effect recorded in the same transaction as the change that caused it.
+
+    Pending messages are claimed by ``apps.outbox.drain`` and handed to the handler registered for ``topic``.
+    """
+    STATUS_CHOICES = [('pending', 'Pending'), ('done', 'Done'), ('dead', 'Dead')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # not claimable before this time: set on creation, pushed forward while claimed and on retry
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'available_at'], name='outbox_claim_idx')]
+
+    def __str__(self):
+        return f"{self.topic} ({self.status})"
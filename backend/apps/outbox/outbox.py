@@ -0,0 +1,161 @@
+"""Transactional outbox.
+
+Side effects (notification emails, export jobs) are written as ``OutboxMessage``
+rows with ``enqueue`` inside the transaction that causes them, so they commit or
+roll back together with it and survive a crash right after the commit.
+``drain`` claims due rows in batches (``SELECT ... FOR UPDATE SKIP LOCKED`` where
+the database supports it) by leasing them for ``OUTBOX_LEASE_SECONDS``, runs the
+registered handlers on a bounded pool and marks them done, or schedules a retry
+with backoff. A worker that dies mid-batch leaves its lease to expire, so
+delivery is at-least-once and handlers must tolerate repeats.
+
+Handlers are registered per topic with ``@handler('topic')`` in an app's
+``tasks`` module; those modules are imported on the first drain. A handler that
+finished part of its work may narrow its payload in place before raising, so the
+retry only covers what is left.
+"""
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_discovered = False
+
+
+def handler(topic):
+    """Register the decorated ``func(payload)`` as the handler for ``topic``."""
+    def register(func):
+        _handlers[topic] = func
+        return func
+    return register
+
+
+def get_handler(topic):
+    global _discovered
+    if not _discovered:
+        autodiscover_modules('tasks')
+        _discovered = True
+    return _handlers.get(topic)
+
+
+def enqueue(topic, payload):
+    """Record a side effect in the current transaction; it is delivered after commit."""
+    return enqueue_many(topic, [payload])[0]
+
+
+def enqueue_many(topic, payloads):
+    messages = OutboxMessage.objects.bulk_create([OutboxMessage(topic=topic, payload=p) for p in payloads])
+    if messages and settings.OUTBOX_DRAIN_ON_COMMIT:
+        transaction.on_commit(kick)
+    return messages
+
+
+def claim(batch_size, now=None):
+    """Lease up to ``batch_size`` due messages to the caller; returns them."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        qs = OutboxMessage.objects.filter(status='pending', available_at__lte=now).order_by('available_at')
+        if connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        messages = list(qs[:batch_size])
+        if messages:
+            lease_until = now + datetime.timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+            for message in messages:
+                message.available_at = lease_until
+                message.attempts += 1
+            OutboxMessage.objects.bulk_update(messages, ['available_at', 'attempts'])
+    return messages
+
+
+def _process(message):
+    try:
+        func = get_handler(message.topic)
+        if func is None:
+            raise LookupError(f'No outbox handler registered for {message.topic!r}')
+        func(message.payload)
+        return message, None
+    except Exception as e:
+        logger.exception('Outbox message %s (%s) failed', message.id, message.topic)
+        return message, e
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            # pool threads do not go through request_finished; release their connection
+            connections.close_all()
+
+
+def _record(results):
+    now = timezone.now()
+    done = [message.id for message, error in results if error is None]
+    if done:
+        OutboxMessage.objects.filter(id__in=done).update(status='done', processed_at=now, last_error='')
+    failed = [(message, error) for message, error in results if error is not None]
+    for message, error in failed:
+        message.last_error = str(error)
+        if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            message.status = 'dead'
+            message.processed_at = now
+        else:
+            delay = min(settings.OUTBOX_RETRY_DELAY * 2 ** (message.attempts - 1), 3600)
+            message.available_at = now + datetime.timedelta(seconds=delay)
+    if failed:
+        OutboxMessage.objects.bulk_update([m for m, _ in failed], ['payload', 'last_error', 'status', 'processed_at', 'available_at'])
+
+
+def drain(batch_size=None, max_workers=None, max_batches=None):
+    """Deliver due messages until none are left (or ``max_batches`` batches); returns how many were handled."""
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    max_workers = max_workers or settings.OUTBOX_MAX_WORKERS
+    handled = 0
+    batches = 0
+    executor = ThreadPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+    try:
+        while max_batches is None or batches < max_batches:
+            messages = claim(batch_size)
+            if not messages:
+                break
+            results = list(executor.map(_process, messages)) if executor else [_process(m) for m in messages]
+            _record(results)
+            handled += len(messages)
+            batches += 1
+    finally:
+        if executor:
+            executor.shutdown()
+    return handled
+
+
+# in-process draining after commit (development, or deployments without a drain worker).
+# Requests are coalesced: at most one background drain is queued at a time.
+_kick_executor = ThreadPoolExecutor(max_workers=1)
+_kick_lock = threading.Lock()
+_kick_pending = False
+
+
+def kick():
+    global _kick_pending
+    with _kick_lock:
+        if _kick_pending:
+            return
+        _kick_pending = True
+    _kick_executor.submit(_background_drain)
+
+
+def _background_drain():
+    global _kick_pending
+    with _kick_lock:
+        _kick_pending = False
+    try:
+        drain()
+    except Exception:
+        logger.exception('Background outbox drain failed')
+    finally:
+        connections.close_all()
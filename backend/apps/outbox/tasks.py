@@ -0,0 +1,17 @@
+"""Periodic outbox draining when a Celery worker is available.
+
+Without Celery, run ``python manage.py drain_outbox --loop`` or rely on
+``OUTBOX_DRAIN_ON_COMMIT`` to drain in-process after each commit.
+"""
+from .outbox import drain
+
+
+try:  # pragma: no cover - optional dependency
+    from celery import shared_task
+
+    @shared_task
+    def drain_outbox():
+        return drain()
+
+except Exception:  # Celery not available — drained by the management command or on commit
+    drain_outbox = None
@@ -0,0 +1,192 @@
+"""Rate limiter backends.
+
+Limits are expressed as ``limit`` hits per sliding ``period`` seconds for an
+identifier (e.g. client IP) inside a scope (e.g. ``form:<id>``). Backends are
+selected with ``settings.RATE_LIMIT_BACKEND``:
+
+- ``LocalRateLimiter``: exact sliding-window log kept in process memory. Fast,
+  but every worker process enforces its own limit.
+- ``CacheRateLimiter``: sliding-window counter stored in a Django cache
+  (Redis/Memcached in production) and shared by all workers. Two fixed-window
+  counters are blended by elapsed time, so bursts at window edges cannot pass
+  twice the limit the way a single fixed window does.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from django.core.cache import caches
+
+
+# ``window`` identifies where an allowed hit was counted (backend-specific); pass it back to ``refund``
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'count', 'limit', 'remaining', 'reset_after', 'window'], defaults=[None])
+
+
+class BaseRateLimiter:
+    clock = staticmethod(time.time)
+
+    def hit(self, scope, ident, limit, period, cost=1):
+        """Consume ``cost`` hits if they fit in the window; never consumes on denial."""
+        raise NotImplementedError
+
+    def peek(self, scope, ident, limit, period):
+        """Return the current state without consuming anything."""
+        raise NotImplementedError
+
+    def refund(self, scope, ident, period, cost=1, window=None):
+        """Give back hits consumed for work that did not go through; ``window`` comes from the ``hit`` result."""
+        raise NotImplementedError
+
+    def reset(self, scope=None, ident=None, period=None):
+        """Forget recorded hits for one identifier, a whole scope, or everything."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _result(allowed, count, limit, reset_after, window=None):
+        count = int(math.ceil(count))
+        return RateLimitResult(allowed, count, limit, max(limit - count, 0), max(reset_after, 0), window)
+
+
+class LocalRateLimiter(BaseRateLimiter):
+    """In-process sliding-window log; memory is bounded by ``max_keys`` and each key's limit."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._logs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _log(self, key, now, period):
+        log = self._logs.get(key)
+        if log is None:
+            log = self._logs[key] = deque()
+            while len(self._logs) > self.max_keys:
+                self._logs.popitem(last=False)
+        else:
+            self._logs.move_to_end(key)
+        while log and log[0] <= now - period:
+            log.popleft()
+        return log
+
+    def hit(self, scope, ident, limit, period, cost=1):
+        now = self.clock()
+        with self._lock:
+            log = self._log((scope, ident), now, period)
+            allowed = len(log) + cost <= limit
+            if allowed:
+                log.extend([now] * cost)
+            reset_after = (log[0] + period - now) if log else 0
+            return self._result(allowed, len(log), limit, reset_after)
+
+    def peek(self, scope, ident, limit, period):
+        now = self.clock()
+        with self._lock:
+            log = self._log((scope, ident), now, period)
+            reset_after = (log[0] + period - now) if log else 0
+            return self._result(len(log) + 1 <= limit, len(log), limit, reset_after)
+
+    def refund(self, scope, ident, period, cost=1, window=None):
+        with self._lock:
+            log = self._logs.get((scope, ident))
+            for _ in range(min(cost, len(log or ()))):
+                log.pop()
+
+    def reset(self, scope=None, ident=None, period=None):
+        with self._lock:
+            if scope is None and ident is None:
+                self._logs.clear()
+                return
+            for key in [k for k in self._logs if (scope is None or k[0] == scope) and (ident is None or k[1] == ident)]:
+                del self._logs[key]
+
+
+class CacheRateLimiter(BaseRateLimiter):
+    """Sliding-window counter on a shared Django cache.
+
+    A hit costs three cache round trips (generation lookup, window read, atomic
+    ``incr``) and no database access. Scope-wide, identifier-wide and global
+    resets bump a generation number because cache keys cannot be enumerated
+    portably.
+    """
+
+    def __init__(self, alias=None, prefix='rl'):
+        from django.conf import settings
+        self.alias = alias or getattr(settings, 'RATE_LIMIT_CACHE_ALIAS', 'default')
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _gen_key(self, scope=None, ident=None):
+        if scope is not None:
+            return f'{self.prefix}:gen:{scope}'
+        if ident is not None:
+            return f'{self.prefix}:gen:ident:{ident}'
+        return f'{self.prefix}:gen'
+
+    def _base_key(self, scope, ident):
+        keys = [self._gen_key(), self._gen_key(scope=scope), self._gen_key(ident=ident)]
+        gens = self.cache.get_many(keys)
+        return f'{self.prefix}:' + ':'.join(str(gens.get(key, 0)) for key in keys) + f':{scope}:{ident}'
+
+    def _window(self, period):
+        now = self.clock()
+        window = int(now // period)
+        return window, 1 - (now - window * period) / period, (window + 1) * period - now
+
+    def _read(self, scope, ident, period):
+        base = self._base_key(scope, ident)
+        window, prev_weight, reset_after = self._window(period)
+        cur_key, prev_key = f'{base}:{window}', f'{base}:{window - 1}'
+        values = self.cache.get_many([prev_key, cur_key])
+        return cur_key, values.get(prev_key, 0) * prev_weight, values.get(cur_key, 0), reset_after
+
+    def hit(self, scope, ident, limit, period, cost=1):
+        cur_key, prev, cur, reset_after = self._read(scope, ident, period)
+        if prev + cur + cost > limit:
+            return self._result(False, prev + cur, limit, reset_after)
+        # windows live for two periods: one as the current window, one as the weighted previous window
+        if self.cache.add(cur_key, cost, timeout=2 * period):
+            cur = cost
+        else:
+            try:
+                cur = self.cache.incr(cur_key, cost)
+            except ValueError:
+                self.cache.set(cur_key, cost, timeout=2 * period)
+                cur = cost
+        if prev + cur > limit:
+            # lost a race with a concurrent hit; undo and deny
+            self._decr(cur_key, cost)
+            return self._result(False, prev + cur - cost, limit, reset_after)
+        return self._result(True, prev + cur, limit, reset_after, window=cur_key)
+
+    def peek(self, scope, ident, limit, period):
+        _, prev, cur, reset_after = self._read(scope, ident, period)
+        return self._result(prev + cur + 1 <= limit, prev + cur, limit, reset_after)
+
+    def refund(self, scope, ident, period, cost=1, window=None):
+        # decrement the window the hit was counted in; it may have rolled over since
+        if window is None:
+            current, _, _ = self._window(period)
+            window = f'{self._base_key(scope, ident)}:{current}'
+        self._decr(window, cost)
+
+    def _decr(self, key, cost):
+        try:
+            self.cache.decr(key, cost)
+        except ValueError:
+            pass
+
+    def reset(self, scope=None, ident=None, period=None):
+        if scope is not None and ident is not None and period:
+            base = self._base_key(scope, ident)
+            window, _, _ = self._window(period)
+            self.cache.delete_many([f'{base}:{window}', f'{base}:{window - 1}'])
+            return
+        if scope is not None and ident is not None:
+            raise ValueError('Resetting one identifier within a scope needs its period.')
+        # identifiers cannot be enumerated in a shared cache: start a new generation instead
+        gen_key = self._gen_key(scope, ident)
+        self.cache.add(gen_key, 0, timeout=None)
+        self.cache.incr(gen_key)
@@ -0,0 +1,60 @@
+"""Per-form submission rate limiting on top of the configured backend.
+
+The ``SubmissionRateLimit`` table is no longer consulted on the request path;
+it is only written when ``RATE_LIMIT_AUDIT`` is enabled, as an audit trail.
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import SubmissionRateLimit
+
+
+_limiter = None
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        _limiter = import_string(settings.RATE_LIMIT_BACKEND)()
+    return _limiter
+
+
+@receiver(setting_changed)
+def _reset_limiter(setting, **kwargs):
+    global _limiter
+    if setting in ('RATE_LIMIT_BACKEND', 'RATE_LIMIT_CACHE_ALIAS'):
+        _limiter = None
+
+
+def form_scope(form):
+    return f'form:{form.pk}'
+
+
+def hit_form(form, ip_address, cost=1):
+    return get_rate_limiter().hit(form_scope(form), ip_address, form.rate_limit_count, form.rate_limit_period, cost=cost)
+
+
+def peek_form(form, ip_address):
+    return get_rate_limiter().peek(form_scope(form), ip_address, form.rate_limit_count, form.rate_limit_period)
+
+
+def refund_form(form, ip_address, cost=1, window=None):
+    """Give back ``cost`` hits; ``window`` is the ``window`` of the ``hit_form`` result that consumed them."""
+    if cost > 0:
+        get_rate_limiter().refund(form_scope(form), ip_address, form.rate_limit_period, cost=cost, window=window)
+
+
+def reset_form(form, ip_address=None):
+    get_rate_limiter().reset(form_scope(form), ip_address, form.rate_limit_period)
+
+
+def record_audit(form, ip_address, count=1):
+    """Append accepted submissions to the SubmissionRateLimit audit trail when enabled."""
+    if not settings.RATE_LIMIT_AUDIT or not count:
+        return
+    rl, created = SubmissionRateLimit.objects.get_or_create(form=form, ip_address=ip_address, defaults={'submission_count': count})
+    if not created:
+        SubmissionRateLimit.objects.filter(pk=rl.pk).update(submission_count=F('submission_count') + count)
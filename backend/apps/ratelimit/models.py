@@ -16,8 +16,8 @@ class SubmissionRateLimit(models.Model):
         unique_together = ['form', 'ip_address']
         indexes = [models.Index(fields=['form', 'ip_address', 'last_submission_at'])]
 
-    def increment_count(self):
-        self.submission_count = models.F('submission_count') + 1
+    def increment_count(self, by=1):
+        self.submission_count = models.F('submission_count') + by
         self.save(update_fields=['submission_count', 'last_submission_at'])
 
     def reset_if_expired(self, rate_limit_period):
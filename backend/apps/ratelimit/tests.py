@@ -0,0 +1,69 @@
+from django.test import SimpleTestCase
+
+from .backends import CacheRateLimiter, LocalRateLimiter
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimiterBackendTests(SimpleTestCase):
+    def make_backends(self):
+        backends = [LocalRateLimiter(), CacheRateLimiter(prefix='rl-test')]
+        for b in backends:
+            b.clock = FakeClock(3600 * 1000)
+            b.reset()
+        return backends
+
+    def test_limit_refund_and_reset(self):
+        for b in self.make_backends():
+            self.assertTrue(b.hit('form:1', '1.2.3.4', 2, 60).allowed)
+            self.assertTrue(b.hit('form:1', '1.2.3.4', 2, 60).allowed)
+            denied = b.hit('form:1', '1.2.3.4', 2, 60)
+            self.assertFalse(denied.allowed)
+            self.assertEqual(denied.remaining, 0)
+            # other identifiers and scopes are independent
+            self.assertTrue(b.hit('form:1', '5.6.7.8', 2, 60).allowed)
+            self.assertTrue(b.hit('form:2', '1.2.3.4', 2, 60).allowed)
+            b.refund('form:1', '1.2.3.4', 60)
+            self.assertTrue(b.peek('form:1', '1.2.3.4', 2, 60).allowed)
+            b.reset('form:1', '1.2.3.4', 60)
+            self.assertEqual(b.peek('form:1', '1.2.3.4', 2, 60).count, 0)
+            b.reset('form:1')
+            self.assertEqual(b.peek('form:1', '5.6.7.8', 2, 60).count, 0)
+            self.assertEqual(b.peek('form:2', '1.2.3.4', 2, 60).count, 1)
+
+    def test_refund_targets_the_hit_window_and_ident_reset(self):
+        b = self.make_backends()[1]
+        b.clock.now += 59
+        hit = b.hit('form:1', 'ip', 4, 60)
+        b.hit('form:2', 'ip', 4, 60)
+        b.hit('form:1', 'other', 4, 60)
+        # the window rolled over before the refund: the hit is taken out of the window that counted it
+        b.clock.now += 2
+        b.hit('form:1', 'ip', 4, 60)
+        b.refund('form:1', 'ip', 60, window=hit.window)
+        self.assertEqual(b.cache.get(hit.window), 0)
+        self.assertEqual(b.peek('form:1', 'ip', 4, 60).count, 1)
+        # resetting an identifier on its own leaves everyone else alone
+        b.reset(ident='ip')
+        self.assertEqual(b.peek('form:1', 'ip', 4, 60).count, 0)
+        self.assertEqual(b.peek('form:2', 'ip', 4, 60).count, 0)
+        self.assertEqual(b.peek('form:1', 'other', 4, 60).count, 1)
+
+    def test_sliding_window_blocks_edge_bursts(self):
+        for b in self.make_backends():
+            # fill the limit at the very end of one window ...
+            b.clock.now += 59
+            for _ in range(4):
+                self.assertTrue(b.hit('form:1', 'ip', 4, 60).allowed)
+            # ... a fixed window would allow another full burst right after the boundary
+            b.clock.now += 2
+            self.assertFalse(b.hit('form:1', 'ip', 4, 60).allowed)
+            # once a full period has passed the budget is back
+            b.clock.now += 60
+            self.assertTrue(b.hit('form:1', 'ip', 4, 60).allowed)
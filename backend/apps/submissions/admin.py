@@ -1,5 +1,7 @@
 ﻿from django.contrib import admin
+from apps.forms.models import Form
 from .models import FormSubmission, Answer
+from .serializers import delete_submissions
 
 
 @admin.register(FormSubmission)
@@ -7,6 +9,14 @@ class FormSubmissionAdmin(admin.ModelAdmin):
     list_display = ('id', 'form', 'submitted_by', 'submitted_at', 'ip_address', 'is_draft')
     list_filter = ('is_draft',)
 
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, FormSubmission.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        # release the forms' accepted-submission slots with one UPDATE per form
+        for form in Form.objects.filter(id__in=queryset.values('form_id')):
+            delete_submissions(form, queryset.filter(form=form))
+
 
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
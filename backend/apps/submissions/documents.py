@@ -0,0 +1,137 @@
+"""Denormalized answer documents.
+
+With ``SUBMISSION_ANSWER_DOCUMENTS`` enabled every submission also stores its
+answers as one JSON document on ``FormSubmission.answers_document``, keyed by
+question id::
+
+    {"<question id>": {"id": "<answer id>", "t": "text", "n": "1.50", "d": "2024-05-01", "c": ["a", "b"]}}
+
+Only the typed columns that hold a value are written. The document is written
+with the rows when a submission is created or finalized and cleared by draft
+autosaves. Readers (submission listing, exports, incremental analytics) use it
+when present and fall back to the ``Answer`` rows otherwise, so enabling the
+setting on an existing database is safe; ``backfill_answer_documents`` fills
+in old submissions and ``check_answer_documents`` reports documents that no
+longer match their rows.
+"""
+import datetime
+import decimal
+
+from django.conf import settings
+
+from apps.forms.models import Question
+from .models import Answer, FormSubmission
+
+# document key -> Answer column
+COLUMNS = {'t': 'answer_text', 'n': 'answer_number', 'd': 'answer_date', 'c': 'answer_choices'}
+
+
+def documents_enabled():
+    return settings.SUBMISSION_ANSWER_DOCUMENTS
+
+
+def encode_answer(answer):
+    entry = {'id': str(answer.id)}
+    if answer.answer_text is not None:
+        entry['t'] = answer.answer_text
+    if answer.answer_number is not None:
+        entry['n'] = str(answer.answer_number)
+    if answer.answer_date is not None:
+        entry['d'] = answer.answer_date.isoformat()
+    if answer.answer_choices is not None:
+        entry['c'] = answer.answer_choices
+    return entry
+
+
+def decode_entry(entry):
+    """Return the typed column values of a document entry as ``{column: value}``."""
+    return {
+        'answer_text': entry.get('t'),
+        'answer_number': decimal.Decimal(entry['n']) if 'n' in entry else None,
+        'answer_date': datetime.date.fromisoformat(entry['d']) if 'd' in entry else None,
+        'answer_choices': entry.get('c'),
+    }
+
+
+def build_document(answers):
+    """Document for a list of ``Answer`` instances (saved or not)."""
+    return {str(answer.question_id): encode_answer(answer) for answer in answers}
+
+
+def load_documents(submission_ids):
+    """Build documents for ``submission_ids`` from their ``Answer`` rows with one query."""
+    documents = {submission_id: {} for submission_id in submission_ids}
+    for answer in Answer.objects.filter(submission_id__in=documents).only('id', 'submission_id', 'question_id', *COLUMNS.values()):
+        documents[answer.submission_id][str(answer.question_id)] = encode_answer(answer)
+    return documents
+
+
+def document_answers(submission, questions):
+    """Unsaved ``Answer`` instances for ``submission``'s document.
+
+    ``questions`` maps question id (as a string) to ``Question``; entries for questions that no longer exist are skipped,
+    as their rows were deleted with the question.
+    """
+    answers = []
+    for question_id, entry in submission.answers_document.items():
+        question = questions.get(question_id)
+        if question is None:
+            continue
+        answers.append(Answer(id=entry['id'], submission=submission, question=question, **decode_entry(entry)))
+    return answers
+
+
+
+def _document_batches(queryset, chunk_size):
+    """Yield ``{submission_id: document}`` pages of ``queryset`` in primary key order."""
+    last = None
+    while True:
+        page = queryset.order_by('id')
+        if last is not None:
+            page = page.filter(id__gt=last)
+        rows = list(page.values_list('id', 'answers_document')[:chunk_size])
+        if not rows:
+            return
+        yield dict(rows)
+        last = rows[-1][0]
+
+
+def write_documents(documents):
+    """Store {submission_id: document} with one bulk update."""
+    FormSubmission.objects.bulk_update([FormSubmission(id=pk, answers_document=doc) for pk, doc in documents.items()], ['answers_document'])
+
+
+def backfill_documents(queryset, chunk_size=1000, rebuild=False):
+    """Write answer documents for the submissions in ``queryset`` from their rows; returns how many were written.
+
+    Submissions that already have a document are skipped unless ``rebuild`` is set.
+    """
+    if not rebuild:
+        queryset = queryset.filter(answers_document__isnull=True)
+    count = 0
+    for page in _document_batches(queryset, chunk_size):
+        write_documents(load_documents(list(page)))
+        count += len(page)
+    return count
+
+
+def _entries_match(stored, expected):
+    return stored.get('id') == expected['id'] and decode_entry(stored) == decode_entry(expected)
+
+
+def find_stale_documents(queryset, chunk_size=1000):
+    """Yield ``(submission_id, expected_document)`` for every document in ``queryset`` that disagrees with its rows.
+
+    Entries for questions that have since been deleted are ignored: their rows went with the question and
+    every reader skips them.
+    """
+    queryset = queryset.filter(answers_document__isnull=False)
+    for page in _document_batches(queryset, chunk_size):
+        expected = load_documents(list(page))
+        extra = {qid for pk, document in page.items() for qid in document if qid not in expected[pk]}
+        live = {str(qid) for qid in Question.objects.filter(id__in=extra).values_list('id', flat=True)} if extra else set()
+        for pk, document in page.items():
+            rows = expected[pk]
+            stored = {qid: entry for qid, entry in document.items() if qid in rows or qid in live}
+            if stored.keys() != rows.keys() or not all(_entries_match(stored[qid], rows[qid]) for qid in rows):
+                yield pk, rows
@@ -0,0 +1,193 @@
+﻿"""Export of a form's accepted submissions in wide format.
+
+Submissions are read with keyset pagination on ``(submitted_at, id)`` and the
+answers for each page come from the submissions' answer documents (see
+``documents``) or are fetched in one query, so memory use and query count
+depend on the page size, not on the number of submissions. The same row
+stream backs the HTTP CSV export and the background export jobs (gzip CSV,
+NDJSON and Parquet files written under ``EXPORT_ROOT``).
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+try:  # pragma: no cover - optional dependency
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:  # parquet exports are unavailable without pyarrow
+    pyarrow = None
+
+from .documents import decode_entry, documents_enabled
+from .models import Answer, SubmissionExport
+
+
+BASE_COLUMNS = ['submission_id', 'submitted_by', 'submitted_at', 'ip_address']
+
+
+def answer_value(answer_text, answer_number, answer_date, answer_choices):
+    """Return the stored value of an answer, whichever typed column holds it."""
+    for value in (answer_text, answer_number, answer_date, answer_choices):
+        if value is not None:
+            return value
+    return None
+
+
+def format_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return '; '.join(str(v) for v in value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_submission_batches(form, batch_size=None):
+    """Yield ``(rows, answers)`` per page of accepted submissions, oldest first.
+
+    ``rows`` are ``(id, submitted_by, submitted_at, ip_address)`` tuples and
+    ``answers`` maps submission id to ``{question_id: value}``.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    username = f'submitted_by__{get_user_model().USERNAME_FIELD}'
+    use_documents = documents_enabled()
+    fields = ['id', username, 'submitted_at', 'ip_address'] + (['answers_document'] if use_documents else [])
+    qs = form.submissions.filter(is_draft=False).order_by('submitted_at', 'id').values_list(*fields)
+    last = None
+    while True:
+        page = qs
+        if last is not None:
+            page = page.filter(Q(submitted_at__gt=last[0]) | Q(submitted_at=last[0], id__gt=last[1]))
+        rows = list(page[:batch_size])
+        if not rows:
+            return
+        answers = {}
+        if use_documents:
+            for row in rows:
+                if row[4] is not None:
+                    answers[row[0]] = {uuid.UUID(qid): answer_value(**decode_entry(entry)) for qid, entry in row[4].items()}
+            rows = [row[:4] for row in rows]
+        missing = [row[0] for row in rows if row[0] not in answers]
+        if missing:
+            answers.update((submission_id, {}) for submission_id in missing)
+            values = Answer.objects.filter(submission_id__in=missing).values_list(
+                'submission_id', 'question_id', 'answer_text', 'answer_number', 'answer_date', 'answer_choices')
+            for submission_id, question_id, *columns in values:
+                answers[submission_id][question_id] = answer_value(*columns)
+        yield rows, answers
+        last = (rows[-1][2], rows[-1][0])
+
+
+def export_questions(form):
+    return list(form.questions.order_by('order').values_list('id', 'question_text'))
+
+
+def iter_row_batches(form, questions, batch_size=None):
+    """Yield lists of formatted wide rows (base columns followed by one cell per question)."""
+    for rows, answers in iter_submission_batches(form, batch_size):
+        batch = []
+        for submission_id, submitted_by, submitted_at, ip_address in rows:
+            values = answers[submission_id]
+            batch.append([str(submission_id), submitted_by or '', submitted_at.isoformat() if submitted_at else '', ip_address or '']
+                         + [format_cell(values.get(qid)) for qid, _ in questions])
+        yield batch
+
+
+def iter_csv(form, batch_size=None):
+    """Yield CSV text for ``form``: the header, then one chunk per page of submissions."""
+    questions = export_questions(form)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(BASE_COLUMNS + [text for _, text in questions])
+    for batch in iter_row_batches(form, questions, batch_size):
+        writer.writerows(batch)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def write_csv_gz(form, path):
+    questions = export_questions(form)
+    count = 0
+    with gzip.open(path, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(BASE_COLUMNS + [text for _, text in questions])
+        for batch in iter_row_batches(form, questions):
+            writer.writerows(batch)
+            count += len(batch)
+    return count
+
+
+def write_ndjson(form, path):
+    """One JSON object per line; answers are keyed by question id and keep their native types."""
+    question_ids = set(form.questions.values_list('id', flat=True))
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for rows, answers in iter_submission_batches(form):
+            lines = []
+            for submission_id, submitted_by, submitted_at, ip_address in rows:
+                record = {'submission_id': submission_id, 'submitted_by': submitted_by, 'submitted_at': submitted_at, 'ip_address': ip_address,
+                          'answers': {str(qid): value for qid, value in answers[submission_id].items() if qid in question_ids}}
+                lines.append(json.dumps(record, cls=DjangoJSONEncoder))
+            f.write('\n'.join(lines) + '\n')
+            count += len(rows)
+    return count
+
+
+def write_parquet(form, path):
+    """Columnar export (one string column per question), written one row group per page."""
+    questions = export_questions(form)
+    columns = BASE_COLUMNS + [str(qid) for qid, _ in questions]
+    schema = pyarrow.schema([(name, pyarrow.string()) for name in columns],
+                            metadata={str(qid): text for qid, text in questions})
+    count = 0
+    with pq.ParquetWriter(path, schema, compression='snappy') as writer:
+        for batch in iter_row_batches(form, questions):
+            writer.write_table(pyarrow.Table.from_arrays([pyarrow.array(col, pyarrow.string()) for col in zip(*batch)], schema=schema))
+            count += len(batch)
+        if not count:
+            writer.write_table(schema.empty_table())
+    return count
+
+
+WRITERS = {
+    'csv.gz': (write_csv_gz, 'application/gzip'),
+    'ndjson': (write_ndjson, 'application/x-ndjson'),
+    'parquet': (write_parquet, 'application/vnd.apache.parquet'),
+}
+
+
+def available_formats():
+    return [fmt for fmt in WRITERS if fmt != 'parquet' or pyarrow is not None]
+
+
+def run_export(export_id):
+    """Build the file for a SubmissionExport job and record the outcome on the job."""
+    job = SubmissionExport.objects.select_related('form').get(id=export_id)
+    SubmissionExport.objects.filter(id=job.id).update(status='running')
+    root = Path(settings.EXPORT_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    file_name = f'{job.id}.{job.format}'
+    tmp_path = root / f'{file_name}.tmp'
+    try:
+        writer, _ = WRITERS[job.format]
+        count = writer(job.form, tmp_path)
+        os.replace(tmp_path, root / file_name)
+    except Exception as e:
+        tmp_path.unlink(missing_ok=True)
+        SubmissionExport.objects.filter(id=job.id).update(status='failed', error=str(e), finished_at=timezone.now())
+        raise
+    SubmissionExport.objects.filter(id=job.id).update(status='done', file_name=file_name, file_size=(root / file_name).stat().st_size,
+                                                       row_count=count, finished_at=timezone.now())
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.forms.models import Form
+from apps.submissions.documents import backfill_documents
+from apps.submissions.models import FormSubmission
+
+
+class Command(BaseCommand):
+    help = 'Write the denormalized answer document of existing submissions from their answer rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Form slugs to backfill (default: all forms)')
+        parser.add_argument('--rebuild', action='store_true', help='Also rewrite submissions that already have a document')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        submissions = FormSubmission.objects.all()
+        if options['slugs']:
+            missing = set(options['slugs']) - set(Form.objects.filter(slug__in=options['slugs']).values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f'Unknown form slug(s): {", ".join(sorted(missing))}')
+            submissions = submissions.filter(form__slug__in=options['slugs'])
+        count = backfill_documents(submissions, chunk_size=options['chunk_size'], rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote answer documents for {count} submission(s).'))
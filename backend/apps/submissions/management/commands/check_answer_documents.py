@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.forms.models import Form
+from apps.submissions.documents import find_stale_documents, write_documents
+from apps.submissions.models import FormSubmission
+
+
+class Command(BaseCommand):
+    help = 'Compare submission answer documents with their answer rows and report (or --fix) the ones that differ.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Form slugs to check (default: all forms)')
+        parser.add_argument('--fix', action='store_true', help='Rewrite stale documents from the answer rows')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        submissions = FormSubmission.objects.all()
+        if options['slugs']:
+            missing = set(options['slugs']) - set(Form.objects.filter(slug__in=options['slugs']).values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f'Unknown form slug(s): {", ".join(sorted(missing))}')
+            submissions = submissions.filter(form__slug__in=options['slugs'])
+        stale = dict(find_stale_documents(submissions, chunk_size=options['chunk_size']))
+        for pk in stale:
+            self.stdout.write(f'Stale document: submission {pk}')
+        if stale and options['fix']:
+            write_documents(stale)
+            self.stdout.write(self.style.SUCCESS(f'Rewrote {len(stale)} stale answer document(s).'))
+        elif stale:
+            raise CommandError(f'{len(stale)} submission(s) have stale answer documents; rerun with --fix to rewrite them.')
+        else:
+            self.stdout.write(self.style.SUCCESS('All answer documents match their rows.'))
@@ -12,9 +12,17 @@ class FormSubmission(models.Model):
     is_draft = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
     last_saved_at = models.DateTimeField(auto_now=True)
+    # answers keyed by question id, kept alongside the Answer rows when SUBMISSION_ANSWER_DOCUMENTS is on (see documents)
+    answers_document = models.JSONField(null=True, blank=True)
 
     class Meta:
-        indexes = [models.Index(fields=['form', 'ip_address', 'submitted_at'])]
+        indexes = [
+            models.Index(fields=['form', 'ip_address', 'submitted_at']),
+            # keyset pagination over a form's submissions in (submitted_at, id) order
+            models.Index(fields=['form', 'is_draft', 'submitted_at', 'id'], name='submission_keyset_idx'),
+            # cursor pagination of the submission listing, which includes drafts
+            models.Index(fields=['form', 'submitted_at', 'id'], name='submission_cursor_idx'),
+        ]
 
     def __str__(self):
         return f"Submission {self.id} for {self.form}"
@@ -35,3 +43,33 @@ class Answer(models.Model):
 
     def __str__(self):
         return f"Answer {self.id} for {self.question}"
+
+
+class SubmissionExport(models.Model):
+    """A background export of a form's accepted submissions to a file under EXPORT_ROOT."""
+    FORMATS = [
+        ('csv.gz', 'Gzip CSV'),
+        ('ndjson', 'NDJSON'),
+        ('parquet', 'Parquet'),
+    ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    form = models.ForeignKey('forms.Form', on_delete=models.CASCADE, related_name='exports')
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    format = models.CharField(max_length=20, choices=FORMATS)
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    file_name = models.CharField(max_length=255, blank=True)
+    file_size = models.BigIntegerField(null=True, blank=True)
+    row_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Export {self.id} ({self.format}) for {self.form}"
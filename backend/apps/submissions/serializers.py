@@ -1,6 +1,19 @@
 ﻿from rest_framework import serializers
-from .models import FormSubmission, Answer
+from django.db import connections, router, transaction
+from django.utils import timezone
+from .models import FormSubmission, Answer, SubmissionExport
 from apps.forms.models import Question
+from apps.forms.validation import CompiledQuestion
+from .documents import build_document, document_answers, documents_enabled
+
+
+class AnswerListSerializer(serializers.ListSerializer):
+    def get_attribute(self, instance):
+        # read the submission's answer document instead of its rows when the view supplied the form's questions
+        questions = self.context.get('questions')
+        if questions is not None and documents_enabled() and getattr(instance, 'answers_document', None) is not None:
+            return document_answers(instance, questions)
+        return super().get_attribute(instance)
 
 
 class AnswerSerializer(serializers.ModelSerializer):
@@ -9,27 +22,22 @@ class AnswerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Answer
         fields = ('id', 'question', 'answer_text', 'answer_number', 'answer_date', 'answer_choices')
+        list_serializer_class = AnswerListSerializer
 
     def validate(self, data):
-        # fetch question and use its runtime validator
-        try:
-            q = Question.objects.get(id=data['question'])
-        except Question.DoesNotExist:
-            raise serializers.ValidationError({'question': 'Invalid question id'})
-        # normalize value based on type
-        value = None
-        if q.question_type in ('text', 'textarea', 'email'):
-            value = data.get('answer_text')
-        elif q.question_type == 'number':
-            value = data.get('answer_number')
-        elif q.question_type == 'date':
-            value = data.get('answer_date')
-        elif q.question_type in ('dropdown', 'radio'):
-            value = data.get('answer_text')
-        elif q.question_type in ('checkbox', 'multiselect'):
-            value = data.get('answer_choices')
-        # delegate validation
-        q.validate_answer(value)
+        # use the form's compiled validator when the view provides one; fall back to a per-answer lookup
+        validator = self.context.get('form_validator')
+        if validator is not None:
+            q = validator.get(data['question'])
+            if q is None:
+                raise serializers.ValidationError({'question': 'Invalid question id'})
+        else:
+            try:
+                q = CompiledQuestion(Question.objects.get(id=data['question']))
+            except Question.DoesNotExist:
+                raise serializers.ValidationError({'question': 'Invalid question id'})
+        # delegate validation of the value stored in the column matching the question type
+        q.validate(q.value_from(data))
         return data
 
 
@@ -41,9 +49,115 @@ class SubmissionSerializer(serializers.ModelSerializer):
         fields = ('id', 'form', 'submitted_by', 'submitted_at', 'ip_address', 'is_draft', 'completed_at', 'last_saved_at', 'answers')
         read_only_fields = ('id', 'submitted_at', 'last_saved_at', 'completed_at')
 
+    def validate_answers(self, answers):
+        # enforce unique_together (submission, question) up front so the batched insert cannot collide
+        seen = set()
+        for a in answers:
+            if a['question'] in seen:
+                raise serializers.ValidationError(f'Duplicate answer for question {a["question"]}.')
+            seen.add(a['question'])
+        return answers
+
     def create(self, validated_data):
         answers = validated_data.pop('answers', [])
-        submission = FormSubmission.objects.create(**validated_data)
-        for a in answers:
-            Answer.objects.create(submission=submission, question_id=a['question'], answer_text=a.get('answer_text'), answer_number=a.get('answer_number'), answer_date=a.get('answer_date'), answer_choices=a.get('answer_choices'))
+        submission = FormSubmission(**validated_data)
+        rows = [build_answer(submission, a) for a in answers]
+        if documents_enabled():
+            submission.answers_document = build_document(rows)
+        submission.save(force_insert=True)
+        Answer.objects.bulk_create(rows)
         return submission
+
+
+class SubmissionExportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SubmissionExport
+        fields = ('id', 'format', 'status', 'row_count', 'file_size', 'error', 'created_at', 'finished_at')
+        read_only_fields = ('id', 'status', 'row_count', 'file_size', 'error', 'created_at', 'finished_at')
+
+
+class BatchSubmissionItemSerializer(SubmissionSerializer):
+    """One entry of a batch upload; form and client IP come from the batch request."""
+
+    class Meta(SubmissionSerializer.Meta):
+        fields = ('is_draft', 'answers')
+
+
+class DraftAnswersSerializer(SubmissionSerializer):
+    """Answers changed since the last autosave of a draft; only these questions are validated."""
+
+    class Meta(SubmissionSerializer.Meta):
+        fields = ('answers',)
+
+
+DRAFT_ANSWER_FIELDS = ['answer_text', 'answer_number', 'answer_date', 'answer_choices']
+
+
+def upsert_draft_answers(submission, answers):
+    """Insert or overwrite ``answers`` of ``submission``, keyed on (submission, question).
+
+    One ``INSERT ... ON CONFLICT`` where the backend supports it. MySQL resolves conflicts on any unique key
+    and rejects a conflict target, so it gets none; backends without upserts update the existing rows and
+    insert the rest.
+    """
+    rows = [build_answer(submission, a) for a in answers]
+    features = connections[router.db_for_write(Answer)].features
+    if features.supports_update_conflicts_with_target:
+        return Answer.objects.bulk_create(rows, update_conflicts=True, unique_fields=['submission', 'question'], update_fields=DRAFT_ANSWER_FIELDS)
+    if features.supports_update_conflicts:
+        return Answer.objects.bulk_create(rows, update_conflicts=True, update_fields=DRAFT_ANSWER_FIELDS)
+    with transaction.atomic():
+        current = Answer.objects.select_for_update().filter(submission=submission, question_id__in=[r.question_id for r in rows])
+        existing = {str(question_id): pk for question_id, pk in current.values_list('question_id', 'pk')}
+        updates, inserts = [], []
+        for row in rows:
+            pk = existing.get(str(row.question_id))
+            if pk is not None:
+                row.pk = pk
+            (updates if pk is not None else inserts).append(row)
+        Answer.objects.bulk_update(updates, DRAFT_ANSWER_FIELDS)
+        Answer.objects.bulk_create(inserts)
+    return rows
+
+
+def bulk_create_submissions(items, **fields):
+    """Insert submissions and all of their answers with one batched insert each.
+
+    ``items`` are validated batch entries; ``fields`` are applied to every submission.
+    """
+    now = timezone.now()
+    submissions = []
+    answers = []
+    for item in items:
+        is_draft = item.get('is_draft', False)
+        submission = FormSubmission(is_draft=is_draft, completed_at=None if is_draft else now, **fields)
+        submissions.append(submission)
+        rows = [build_answer(submission, a) for a in item.get('answers', [])]
+        if documents_enabled():
+            submission.answers_document = build_document(rows)
+        answers.extend(rows)
+    FormSubmission.objects.bulk_create(submissions)
+    Answer.objects.bulk_create(answers)
+    return submissions
+
+
+def delete_submissions(form, submissions):
+    """Delete the ``submissions`` queryset of ``form``, releasing the slots and analytics of the accepted ones.
+
+    Runs a constant number of statements (no per-row signals, so Django can fast-delete the rows).
+    """
+    from apps.analytics.aggregates import discard_submissions
+
+    with transaction.atomic():
+        accepted = list(submissions.filter(is_draft=False).values_list('id', flat=True))
+        # aggregates are computed from the answers, so take them out before the rows go
+        discard_submissions(form, accepted)
+        deleted = submissions.delete()
+        if accepted:
+            form.release_submission_slots(len(accepted))
+    return deleted
+
+
+def build_answer(submission, data):
+    """Return an unsaved Answer for ``submission`` from validated answer data."""
+    return Answer(submission=submission, question_id=data['question'], answer_text=data.get('answer_text'), answer_number=data.get('answer_number'), answer_date=data.get('answer_date'), answer_choices=data.get('answer_choices'))
@@ -0,0 +1,41 @@
+"""Background export jobs.
+
+Export requests are recorded in the transactional outbox together with the job
+row; the outbox handler hands them to Celery if it is installed and configured,
+or to an in-process ThreadPoolExecutor for development/testing environments
+where Celery/Redis may not be available.
+"""
+from apps.outbox.outbox import handler
+from .export import run_export
+
+EXPORT_TOPIC = 'submissions.export'
+
+
+try:  # pragma: no cover - optional dependency
+    from celery import shared_task
+
+    @shared_task(bind=True, acks_late=True)
+    def build_submission_export(self, export_id):
+        run_export(export_id)
+        return {'status': 'done'}
+
+    def dispatch_export(export):
+        build_submission_export.delay(str(export.id))
+
+except Exception:  # Celery not available — fallback
+    from concurrent.futures import ThreadPoolExecutor
+
+    _executor = ThreadPoolExecutor(max_workers=2)
+
+
+    def dispatch_export(export):
+        _executor.submit(run_export, export.id)
+
+
+@handler(EXPORT_TOPIC)
+def start_export(payload):
+    from .models import SubmissionExport
+
+    export = SubmissionExport.objects.filter(id=payload['export_id'], status='pending').first()
+    if export is not None:
+        dispatch_export(export)
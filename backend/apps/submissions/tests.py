@@ -5,6 +5,23 @@ from django.utils import timezone
 from apps.forms.models import Form, Question
 from django.contrib.auth import get_user_model
 import json
+import csv
+import gzip
+import io
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from apps.forms.admin import reset_submissions
+from apps.forms.validation import get_form_validator
+from apps.outbox.outbox import drain
+from apps.ratelimit.limiter import peek_form
+from apps.submissions.export import iter_csv, run_export
+from apps.submissions.models import Answer, FormSubmission
+from apps.submissions.serializers import SubmissionSerializer, bulk_create_submissions, delete_submissions, upsert_draft_answers
 
 User = get_user_model()
 
@@ -99,10 +116,274 @@ class SubmissionFlowTests(TestCase):
         r3 = self.client.post(f'/api/forms/{self.form.slug}/submissions/', data=json.dumps(data), content_type='application/json')
         self.assertEqual(r3.status_code, 403)
 
-        # Now simulate admin reset by calling admin action (via admin API is read-only here),
-        # so perform cleanup using ORM to simulate the admin action
-        self.form.submissions.filter(is_draft=False).delete()
+        # Now reset through the admin action (the admin API is read-only here)
+        reset_submissions(None, None, Form.objects.filter(pk=self.form.pk))
 
         # after reset, submissions should be accepted again
         r4 = self.client.post(f'/api/forms/{self.form.slug}/submissions/', data=json.dumps(data), content_type='application/json')
         self.assertEqual(r4.status_code, 201)
+
+    def test_validation_uses_compiled_plan(self):
+        # a larger form validates with a single question lookup regardless of answer count
+        self.form.rate_limit_count = 100
+        self.form.save()
+        questions = [Question.objects.create(form=self.form, question_text=f'Pick {i}', question_type='radio', order=i + 2, options=['a', 'b']) for i in range(10)]
+        answers = [{'question': str(self.q.id), 'answer_text': 'N'}] + [{'question': str(q.id), 'answer_text': 'a'} for q in questions]
+        data = {'is_draft': False, 'answers': answers}
+        url = f'/api/forms/{self.form.slug}/submissions/'
+        self.form.refresh_from_db()
+        validator = get_form_validator(self.form)
+        self.assertIs(get_form_validator(self.form), validator)
+        serializer = SubmissionSerializer(data={**data, 'form': str(self.form.id)}, context={'form_validator': validator})
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        # only the form primary key lookup remains; no per-answer question queries
+        self.assertEqual(len(ctx.captured_queries), 1)
+        resp = self.client.post(url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(resp.status_code, 201)
+
+        # invalid option and questions from another form are rejected
+        bad = {'is_draft': False, 'answers': [{'question': str(questions[0].id), 'answer_text': 'z'}]}
+        self.assertEqual(self.client.post(url, data=json.dumps(bad), content_type='application/json').status_code, 400)
+        other = Form.objects.create(title='O', created_by=self.user, slug='other-form')
+        oq = Question.objects.create(form=other, question_text='Other', question_type='text', order=1)
+        foreign = {'is_draft': False, 'answers': [{'question': str(oq.id), 'answer_text': 'x'}]}
+        self.assertEqual(self.client.post(url, data=json.dumps(foreign), content_type='application/json').status_code, 400)
+
+        # editing a question bumps the form version and recompiles the plan
+        questions[0].options = ['a', 'b', 'z']
+        questions[0].save()
+        self.assertEqual(self.client.post(url, data=json.dumps(bad), content_type='application/json').status_code, 201)
+
+    def test_answers_inserted_in_one_batch(self):
+        q2 = Question.objects.create(form=self.form, question_text='Age', question_type='number', order=2)
+        data = {'is_draft': False, 'answers': [{'question': str(self.q.id), 'answer_text': 'A'}, {'question': str(q2.id), 'answer_number': 42}]}
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(f'/api/forms/{self.form.slug}/submissions/', data=json.dumps(data), content_type='application/json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(len(resp.json()['answers']), 2)
+        answer_inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "submissions_answer"')]
+        self.assertEqual(len(answer_inserts), 1)
+        # duplicate answers for one question are rejected before insert
+        dup = {'is_draft': False, 'answers': [{'question': str(self.q.id), 'answer_text': 'A'}, {'question': str(self.q.id), 'answer_text': 'B'}]}
+        resp = self.client.post(f'/api/forms/{self.form.slug}/submissions/', data=json.dumps(dup), content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_batch_upload(self):
+        self.form.submission_limit = 3
+        self.form.rate_limit_count = 10
+        self.form.save()
+        items = [{'is_draft': False, 'answers': [{'question': str(self.q.id), 'answer_text': f'K{i}'}]} for i in range(4)]
+        items.insert(1, {'is_draft': False, 'answers': [{'question': 'not-a-uuid', 'answer_text': 'x'}]})
+        items.append({'is_draft': True, 'answers': [{'question': str(self.q.id), 'answer_text': 'draft'}]})
+        resp = self.client.post(f'/api/forms/{self.form.slug}/submissions/batch/', data=json.dumps({'submissions': items}), content_type='application/json')
+        self.assertEqual(resp.status_code, 200)
+        j = resp.json()
+        statuses = [r['status'] for r in j['results']]
+        # invalid item and the item over submission_limit fail; the draft is not capped
+        self.assertEqual(statuses, ['created', 'error', 'created', 'created', 'error', 'created'])
+        self.assertEqual(j['created'], 4)
+        self.assertEqual(self.form.submissions.filter(is_draft=False).count(), 3)
+        self.assertEqual(self.form.submissions.get(is_draft=False, answers__answer_text='K0').answers.count(), 1)
+        self.assertEqual(peek_form(self.form, '127.0.0.1').count, 4)
+
+    def test_submission_limit_counter_and_finalize(self):
+        self.form.submission_limit = 1
+        self.form.rate_limit_count = 100
+        self.form.save()
+        url = f'/api/forms/{self.form.slug}/submissions/'
+        draft = {'is_draft': True, 'answers': [{'question': str(self.q.id), 'answer_text': 'D'}]}
+        final = {'is_draft': False, 'answers': [{'question': str(self.q.id), 'answer_text': 'F'}]}
+        sid = self.client.post(url, data=json.dumps(draft), content_type='application/json').json()['id']
+        self.assertEqual(self.client.post(url, data=json.dumps(final), content_type='application/json').status_code, 201)
+        self.form.refresh_from_db()
+        self.assertEqual(self.form.accepted_submissions, 1)
+        # the cap is full, so finalizing the draft is rejected and it stays a draft
+        self.assertEqual(self.client.post(f'{url}{sid}/finalize/').status_code, 403)
+        self.assertTrue(self.form.submissions.get(id=sid).is_draft)
+        # the admin reset frees the slot again
+        reset_submissions(None, None, Form.objects.filter(pk=self.form.pk))
+        self.form.refresh_from_db()
+        self.assertEqual(self.form.accepted_submissions, 0)
+        self.assertEqual(self.client.post(f'{url}{sid}/finalize/').status_code, 200)
+        self.form.refresh_from_db()
+        self.assertEqual(self.form.accepted_submissions, 1)
+
+        # saving a stale Form instance does not clobber the maintained counter
+        stale = Form.objects.get(pk=self.form.pk)
+        Form.objects.filter(pk=self.form.pk).update(accepted_submissions=5)
+        stale.title = 'Renamed'
+        stale.save()
+        self.form.refresh_from_db()
+        self.assertEqual((self.form.title, self.form.accepted_submissions), ('Renamed', 5))
+
+    def test_delete_releases_slots_in_constant_queries(self):
+        items = [{'is_draft': False, 'answers': [{'question': self.q.id, 'answer_text': f'A{i}'}]} for i in range(8)]
+        submissions = bulk_create_submissions(items, form=self.form)
+        self.form.recount_accepted_submissions()
+        self.assertEqual(self.client.delete(f'/api/forms/{self.form.slug}/submissions/{submissions[0].id}/').status_code, 204)
+        self.form.refresh_from_db()
+        self.assertEqual(self.form.accepted_submissions, 7)
+        counts = []
+        for ids in ([s.id for s in submissions[1:3]], [s.id for s in submissions[3:]]):
+            with CaptureQueriesContext(connection) as ctx:
+                delete_submissions(self.form, FormSubmission.objects.filter(id__in=ids))
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        self.form.refresh_from_db()
+        self.assertEqual(self.form.accepted_submissions, 0)
+        # partial grants when the cap has less room than requested
+        Form.objects.filter(pk=self.form.pk).update(submission_limit=5, accepted_submissions=3)
+        self.assertEqual(self.form.reserve_available_submission_slots(4), 2)
+        self.assertEqual(self.form.reserve_available_submission_slots(4), 0)
+
+    def test_wide_csv_export(self):
+        self.form.rate_limit_count = 10
+        self.form.save()
+        q2 = Question.objects.create(form=self.form, question_text='Tags', question_type='checkbox', order=2, options=['x', 'y'])
+        for i in range(5):
+            data = {'is_draft': False, 'answers': [{'question': str(self.q.id), 'answer_text': f'Val{i}'}, {'question': str(q2.id), 'answer_choices': ['x', 'y']}]}
+            self.client.post(f'/api/forms/{self.form.slug}/submissions/', data=json.dumps(data), content_type='application/json')
+        # pages of two rows: header chunk plus three batches, each carrying several rows
+        chunks = list(iter_csv(self.form, batch_size=2))
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader(io.StringIO(''.join(chunks))))
+        self.assertEqual(rows[0], ['submission_id', 'submitted_by', 'submitted_at', 'ip_address', 'Your name', 'Tags'])
+        self.assertEqual([r[4] for r in rows[1:]], [f'Val{i}' for i in range(5)])
+        self.assertEqual(rows[1][5], 'x; y')
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.get(f'/api/forms/{self.form.slug}/submissions/export/')
+        self.assertEqual(list(csv.reader(io.StringIO(b''.join(resp.streaming_content).decode()))), rows)
+
+    def test_background_export_job(self):
+        data = {'is_draft': False, 'answers': [{'question': str(self.q.id), 'answer_text': 'Gautam'}]}
+        self.client.post(f'/api/forms/{self.form.slug}/submissions/', data=json.dumps(data), content_type='application/json')
+        self.client.force_authenticate(user=self.user)
+        with tempfile.TemporaryDirectory() as root, override_settings(EXPORT_ROOT=root):
+            base = f'/api/forms/{self.form.slug}/exports/'
+            resp = self.client.post(base, {'format': 'ndjson'}, format='json')
+            self.assertEqual(resp.status_code, 202)
+            job_id = resp.json()['id']
+            # the job is handed to the worker through the outbox, committed with the job row
+            with mock.patch('apps.submissions.tasks.dispatch_export') as dispatch:
+                self.assertEqual(drain(max_workers=1), 1)
+            self.assertEqual(str(dispatch.call_args.args[0].id), job_id)
+            self.assertEqual(self.client.post(base, {'format': 'xlsx'}, format='json').status_code, 400)
+            self.assertEqual(self.client.get(f'{base}{job_id}/download/').status_code, 409)
+
+            run_export(job_id)
+            job = self.client.get(f'{base}{job_id}/').json()
+            self.assertEqual((job['status'], job['row_count']), ('done', 1))
+            resp = self.client.get(f'{base}{job_id}/download/')
+            record = json.loads(b''.join(resp.streaming_content))
+            self.assertEqual(record['answers'], {str(self.q.id): 'Gautam'})
+            # resumable download of the tail of the file
+            resp = self.client.get(f'{base}{job_id}/download/', HTTP_RANGE='bytes=-10')
+            self.assertEqual(resp.status_code, 206)
+            self.assertEqual(resp['Content-Range'], f'bytes {job["file_size"] - 10}-{job["file_size"] - 1}/{job["file_size"]}')
+            self.assertEqual(len(b''.join(resp.streaming_content)), 10)
+            self.assertEqual(self.client.get(f'{base}{job_id}/download/', HTTP_RANGE=f'bytes={job["file_size"]}-').status_code, 416)
+
+            job_id = self.client.post(base, {'format': 'csv.gz'}, format='json').json()['id']
+            run_export(job_id)
+            resp = self.client.get(f'{base}{job_id}/download/')
+            lines = gzip.decompress(b''.join(resp.streaming_content)).decode().splitlines()
+            self.assertEqual(len(lines), 2)
+            self.assertTrue(lines[1].endswith(',Gautam'))
+
+    def test_cursor_pagination(self):
+        base = timezone.now()
+        ids = []
+        for i in range(5):
+            s = FormSubmission.objects.create(form=self.form, is_draft=False)
+            # two submissions share a timestamp so the id tie-breaker is exercised
+            FormSubmission.objects.filter(pk=s.pk).update(submitted_at=base - timedelta(minutes=min(i, 3)))
+            ids.append(str(s.id))
+        self.form.recount_accepted_submissions()
+        self.client.force_authenticate(user=self.user)
+        url = f'/api/forms/{self.form.slug}/submissions/report/?page_size=2'
+        seen, pages = [], []
+        while url:
+            j = self.client.get(url).json()
+            self.assertEqual(j['count'], 5)
+            pages.append(j)
+            seen += [r['id'] for r in j['results']]
+            url = j['next']
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(sorted(seen), sorted(ids))
+        self.assertEqual(len(set(seen)), 5)
+        # walking back from the last page returns the middle page
+        back = self.client.get(pages[-1]['previous']).json()
+        self.assertEqual(back['results'], pages[1]['results'])
+        self.assertEqual(self.client.get(f'/api/forms/{self.form.slug}/submissions/report/?cursor=bogus').status_code, 404)
+        # the public listing uses the same cursor and only counts on request
+        j = self.client.get(f'/api/forms/{self.form.slug}/submissions/?page_size=3').json()
+        self.assertIsNone(j['count'])
+        self.assertEqual(len(j['results']), 3)
+        self.assertEqual(self.client.get(f'/api/forms/{self.form.slug}/submissions/?count=true').json()['count'], 5)
+
+    def test_draft_autosave_upserts_changed_answers(self):
+        q2 = Question.objects.create(form=self.form, question_text='Age', question_type='number', order=2, min_value=0)
+        data = {'is_draft': True, 'answers': [{'question': str(self.q.id), 'answer_text': 'Ga'}]}
+        sid = self.client.post(f'/api/forms/{self.form.slug}/submissions/', data=json.dumps(data), content_type='application/json').json()['id']
+        before = FormSubmission.objects.get(id=sid).last_saved_at
+        url = f'/api/forms/{self.form.slug}/submissions/{sid}/'
+        patch = {'answers': [{'question': str(self.q.id), 'answer_text': 'Gautam'}, {'question': str(q2.id), 'answer_number': 30}]}
+        resp = self.client.patch(url, data=json.dumps(patch), content_type='application/json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['saved'], 2)
+        answers = dict(Answer.objects.filter(submission_id=sid).values_list('question_id', 'answer_text'))
+        self.assertEqual(answers, {self.q.id: 'Gautam', q2.id: None})
+        self.assertGreater(FormSubmission.objects.get(id=sid).last_saved_at, before)
+        # only the touched question is validated
+        bad = {'answers': [{'question': str(q2.id), 'answer_number': -1}]}
+        self.assertEqual(self.client.patch(url, data=json.dumps(bad), content_type='application/json').status_code, 400)
+        self.assertEqual(Answer.objects.get(submission_id=sid, question=q2).answer_number, 30)
+        self.client.post(f'{url}finalize/')
+        self.assertEqual(self.client.patch(url, data=json.dumps(patch), content_type='application/json').status_code, 400)
+
+    def test_draft_upsert_without_native_upserts(self):
+        q2 = Question.objects.create(form=self.form, question_text='Age', question_type='number', order=2)
+        submission = FormSubmission.objects.create(form=self.form, is_draft=True)
+        kept = Answer.objects.create(submission=submission, question=self.q, answer_text='Ga')
+        with mock.patch.multiple(connection.features, supports_update_conflicts=False, supports_update_conflicts_with_target=False):
+            upsert_draft_answers(submission, [{'question': self.q.id, 'answer_text': 'Gautam'}, {'question': q2.id, 'answer_number': 30}])
+        rows = {a.question_id: a for a in Answer.objects.filter(submission=submission)}
+        self.assertEqual((rows[self.q.id].pk, rows[self.q.id].answer_text), (kept.pk, 'Gautam'))
+        self.assertEqual(rows[q2.id].answer_number, 30)
+
+    def test_answer_documents(self):
+        self.form.rate_limit_enabled = False
+        self.form.save()
+        q2 = Question.objects.create(form=self.form, question_text='Age', question_type='number', order=2)
+        q3 = Question.objects.create(form=self.form, question_text='Tags', question_type='checkbox', order=3, options=['x', 'y'])
+        answers = [{'question': str(self.q.id), 'answer_text': 'Ann'}, {'question': str(q2.id), 'answer_number': 30}, {'question': str(q3.id), 'answer_choices': ['x']}]
+        url = f'/api/forms/{self.form.slug}/submissions/'
+        with override_settings(SUBMISSION_ANSWER_DOCUMENTS=False):
+            plain_id = self.client.post(url, data=json.dumps({'is_draft': False, 'answers': answers}), content_type='application/json').json()['id']
+        with override_settings(SUBMISSION_ANSWER_DOCUMENTS=True):
+            doc_id = self.client.post(url, data=json.dumps({'is_draft': False, 'answers': answers}), content_type='application/json').json()['id']
+            document = FormSubmission.objects.get(id=doc_id).answers_document
+            self.assertEqual(document[str(q2.id)]['n'], '30.00')
+            self.assertIsNone(FormSubmission.objects.get(id=plain_id).answers_document)
+            # readers give the same results from the document as from the rows
+            listed = {s['id']: s['answers'] for s in self.client.get(url).json()['results']}
+            strip = lambda items: sorted((dict(a, id=None) for a in items), key=lambda a: a['question'])
+            self.assertEqual(strip(listed[doc_id]), strip(listed[plain_id]))
+            rows = list(csv.reader(io.StringIO(''.join(iter_csv(self.form)))))
+            self.assertEqual(rows[1][4:], rows[2][4:])
+            # drafts: autosave drops the document, finalize rebuilds it
+            draft_id = self.client.post(url, data=json.dumps({'is_draft': True, 'answers': answers[:1]}), content_type='application/json').json()['id']
+            self.client.patch(f'{url}{draft_id}/', data=json.dumps({'answers': [{'question': str(self.q.id), 'answer_text': 'Bo'}]}), content_type='application/json')
+            self.assertIsNone(FormSubmission.objects.get(id=draft_id).answers_document)
+            self.client.post(f'{url}{draft_id}/finalize/')
+            self.assertEqual(FormSubmission.objects.get(id=draft_id).answers_document[str(self.q.id)]['t'], 'Bo')
+            # backfill and consistency check
+            call_command('backfill_answer_documents', stdout=io.StringIO())
+            self.assertIsNotNone(FormSubmission.objects.get(id=plain_id).answers_document)
+            call_command('check_answer_documents', stdout=io.StringIO())
+            Answer.objects.filter(submission_id=doc_id, question=self.q).update(answer_text='Changed')
+            with self.assertRaises(CommandError):
+                call_command('check_answer_documents', stdout=io.StringIO())
+            call_command('check_answer_documents', fix=True, stdout=io.StringIO())
+            self.assertEqual(FormSubmission.objects.get(id=doc_id).answers_document[str(self.q.id)]['t'], 'Changed')
@@ -1,22 +1,35 @@
-﻿from rest_framework import viewsets, status
+﻿import os
+
+from rest_framework import viewsets, status
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.conf import settings
 from django.core.mail import send_mail
 from django.db import transaction
+from django.db.models import Prefetch
 
-from apps.core.utils import get_client_ip
+from apps.core.utils import get_client_ip, ranged_file_response
+from apps.core.pagination import KeysetPagination
 
-from .models import FormSubmission, Answer
+from .models import FormSubmission, Answer, SubmissionExport
 from apps.forms.models import Form, Question
-from apps.ratelimit.models import SubmissionRateLimit
+from apps.forms.access import has_form_access
+from apps.forms.validation import get_form_validator
+from apps.ratelimit import limiter as ratelimit
+from apps.analytics.aggregates import record_submissions
 from apps.notifications.models import FormNotificationLog
-from .serializers import SubmissionSerializer
-from apps.notifications.tasks import dispatch_notification
+from .serializers import (SubmissionSerializer, BatchSubmissionItemSerializer, DraftAnswersSerializer, SubmissionExportSerializer,
+                          bulk_create_submissions, delete_submissions, upsert_draft_answers)
+from .export import WRITERS, available_formats
+from .documents import documents_enabled, load_documents
+from .tasks import EXPORT_TOPIC
+from apps.outbox import outbox
+from apps.notifications.tasks import notify_submissions
 
 
 @extend_schema(
@@ -29,66 +42,183 @@ class SubmissionViewSet(viewsets.ModelViewSet):
     serializer_class = SubmissionSerializer
     permission_classes = [AllowAny]
     lookup_field = 'id'
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         form_slug = self.kwargs.get('form_slug')
-        form = get_object_or_404(Form, slug=form_slug)
-        return FormSubmission.objects.filter(form=form)
+        form = self.form = get_object_or_404(Form, slug=form_slug)
+        qs = FormSubmission.objects.filter(form=form)
+        if self.action in ('list', 'retrieve'):
+            if documents_enabled():
+                # submissions with an answer document are rendered from it; only fetch rows for the others
+                qs = qs.prefetch_related(Prefetch('answers', queryset=Answer.objects.filter(submission__answers_document__isnull=True).select_related('question')))
+            else:
+                qs = qs.prefetch_related('answers__question')
+        return qs
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'retrieve') and documents_enabled() and hasattr(self, 'form'):
+            context['questions'] = {str(q.id): q for q in self.form.questions.all()}
+        return context
+
+    def get_serializer(self, *args, form=None, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if form is not None:
+            # validate answers against the form's compiled plan (one question lookup per request)
+            serializer.context['form_validator'] = get_form_validator(form)
+        return serializer
+
+    def perform_destroy(self, instance):
+        delete_submissions(instance.form, FormSubmission.objects.filter(pk=instance.pk))
 
     def create(self, request, form_slug=None):
         form = get_object_or_404(Form, slug=form_slug)
         # expiry and active checks
         if form.is_expired() or not form.is_active:
             return Response({'detail': 'Form not accepting submissions.'}, status=status.HTTP_410_GONE)
+        if not has_form_access(request, form):
+            return Response({'detail': 'Access code required.'}, status=status.HTTP_403_FORBIDDEN)
 
         ip = get_client_ip(request)
-        # enforce rate limit
-        if form.rate_limit_enabled:
-            rl, _ = SubmissionRateLimit.objects.get_or_create(form=form, ip_address=ip)
-            rl.reset_if_expired(form.rate_limit_period)
-            if not rl.is_within_limit(form.rate_limit_count):
-                return Response({'detail': 'Rate limit exceeded.'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
-
-        # enforce submission cap if set
-        if form.submission_limit is not None:
-            current_count = form.submissions.filter(is_draft=False).count()
-            if current_count >= form.submission_limit:
-                return Response({'detail': 'Submission limit reached for this form.'}, status=status.HTTP_403_FORBIDDEN)
+        # cheap pre-check of the submission cap against the row we already loaded
+        if not form.has_submission_capacity():
+            return Response({'detail': 'Submission limit reached for this form.'}, status=status.HTTP_403_FORBIDDEN)
+
+        # enforce rate limit; the hit is consumed up front and refunded if the submission is not stored
+        hit = ratelimit.hit_form(form, ip) if form.rate_limit_enabled else None
+        if hit is not None and not hit.allowed:
+            return Response({'detail': 'Rate limit exceeded.'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        refund = 1 if hit is not None else 0
 
         payload = request.data.copy()
         payload['form'] = str(form.id)
         payload['ip_address'] = ip
 
-        # Use a DB transaction and lock the Form row to enforce submission_limit safely under concurrency
+        serializer = self.get_serializer(data=payload, form=form)
+        if not serializer.is_valid():
+            ratelimit.refund_form(form, ip, refund, window=getattr(hit, 'window', None))
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        is_draft = serializer.validated_data.get('is_draft', False)
+
         with transaction.atomic():
-            locked_form = Form.objects.select_for_update().get(id=form.id)
-            # re-check submission cap under lock
-            if locked_form.submission_limit is not None:
-                current_count = locked_form.submissions.filter(is_draft=False).count()
-                if current_count >= locked_form.submission_limit:
-                    return Response({'detail': 'Submission limit reached for this form.'}, status=status.HTTP_403_FORBIDDEN)
-
-            serializer = self.get_serializer(data=payload)
-            serializer.is_valid(raise_exception=True)
-            submission = serializer.save()
-
-            # increment rate limit
-            if locked_form.rate_limit_enabled:
-                rl.increment_count()
-
-        # if not a draft, mark completed and send notifications
-        if not submission.is_draft:
-            submission.completed_at = timezone.now()
-            submission.save(update_fields=['completed_at'])
-            if form.enable_email_notifications and form.notification_emails:
-                def _notify():
-                    for to in form.notification_emails:
-                        dispatch_notification(form, submission, f'New submission for {form.title}', 'A new submission was received.', to)
+            submission = serializer.save(completed_at=None if is_draft else timezone.now())
+            # claim a slot last so the Form row is only locked for the commit; no lock or COUNT(*) beforehand
+            if not is_draft and not form.reserve_submission_slots():
+                transaction.set_rollback(True)
+                ratelimit.refund_form(form, ip, refund, window=getattr(hit, 'window', None))
+                return Response({'detail': 'Submission limit reached for this form.'}, status=status.HTTP_403_FORBIDDEN)
+
+            if form.rate_limit_enabled:
+                ratelimit.record_audit(form, ip)
+            if not is_draft:
+                record_submissions(form, [submission.id])
 
-                transaction.on_commit(_notify)
+            if not is_draft:
+                notify_submissions(form, [submission], f'New submission for {form.title}', 'A new submission was received.')
 
         return Response(SubmissionSerializer(submission).data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request, form_slug=None):
+        """Ingest many submissions at once (offline/kiosk uploads).
+
+        Accepts ``{"submissions": [...]}`` (or a bare list) where each item has ``is_draft`` and ``answers``.
+        All items are validated against one compiled question set, accepted items are inserted in bulk and
+        rate-limit / submission_limit accounting is applied once for the whole batch. Returns per-item results.
+        """
+        form = get_object_or_404(Form, slug=form_slug)
+        if form.is_expired() or not form.is_active:
+            return Response({'detail': 'Form not accepting submissions.'}, status=status.HTTP_410_GONE)
+        if not has_form_access(request, form):
+            return Response({'detail': 'Access code required.'}, status=status.HTTP_403_FORBIDDEN)
+
+        items = request.data.get('submissions') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'detail': 'Expected a non-empty list of submissions.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.SUBMISSION_BATCH_MAX_SIZE:
+            return Response({'detail': f'Batch too large (max {settings.SUBMISSION_BATCH_MAX_SIZE}).'}, status=status.HTTP_400_BAD_REQUEST)
+
+        ip = get_client_ip(request)
+        context = {**self.get_serializer_context(), 'form_validator': get_form_validator(form)}
+        results = []
+        valid = []
+        for index, item in enumerate(items):
+            serializer = BatchSubmissionItemSerializer(data=item, context=context)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+                results.append(None)
+            else:
+                results.append({'index': index, 'status': 'error', 'errors': serializer.errors})
+
+        # one rate-limit reservation for the whole batch; unused hits are refunded below
+        allowance = len(valid)
+        hit = None
+        if form.rate_limit_enabled and allowance:
+            allowance = min(allowance, ratelimit.peek_form(form, ip).remaining)
+            if allowance:
+                hit = ratelimit.hit_form(form, ip, cost=allowance)
+                if not hit.allowed:
+                    allowance = 0
+        reserved = allowance
+
+        with transaction.atomic():
+            wanted = sum(1 for _, data in valid[:allowance] if not data.get('is_draft', False))
+            capacity = form.reserve_available_submission_slots(wanted) if wanted else 0
+            accepted = []
+            for index, data in valid:
+                if allowance <= 0:
+                    results[index] = {'index': index, 'status': 'error', 'errors': {'detail': 'Rate limit exceeded.'}}
+                    continue
+                if not data.get('is_draft', False):
+                    if capacity <= 0:
+                        results[index] = {'index': index, 'status': 'error', 'errors': {'detail': 'Submission limit reached for this form.'}}
+                        continue
+                    capacity -= 1
+                allowance -= 1
+                accepted.append((index, data))
+
+            submissions = bulk_create_submissions([data for _, data in accepted], form=form, ip_address=ip)
+            if form.rate_limit_enabled:
+                ratelimit.refund_form(form, ip, reserved - len(submissions), window=getattr(hit, 'window', None))
+                ratelimit.record_audit(form, ip, len(submissions))
+            completed = [s for s in submissions if not s.is_draft]
+            record_submissions(form, [s.id for s in completed])
+            notify_submissions(form, completed, f'New submission for {form.title}', 'A new submission was received.')
+
+        for (index, _), submission in zip(accepted, submissions):
+            results[index] = {'index': index, 'status': 'created', 'id': str(submission.id), 'is_draft': submission.is_draft}
+
+        return Response({'created': len(submissions), 'failed': len(items) - len(submissions), 'results': results})
+
+    def partial_update(self, request, form_slug=None, id=None):
+        """Autosave a draft: ``{"answers": [...]}`` with only the changed answers.
+
+        The answers are validated against their own questions only and upserted on (submission, question) in a
+        single statement; the response is just the new ``last_saved_at`` rather than the whole submission.
+        """
+        submission = get_object_or_404(FormSubmission.objects.select_related('form'), id=id, form__slug=form_slug)
+        form = submission.form
+        if not submission.is_draft:
+            return Response({'detail': 'Only drafts can be updated.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not form.allow_partial_saves:
+            return Response({'detail': 'Partial saves are disabled for this form.'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = DraftAnswersSerializer(data=request.data, context={'form_validator': get_form_validator(form)})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        answers = serializer.validated_data.get('answers', [])
+
+        saved_at = timezone.now()
+        with transaction.atomic():
+            # bump last_saved_at only while it is still a draft, so an autosave racing finalize cannot land after it
+            # the answer document (if any) is rebuilt from the rows when the draft is finalized
+            if not FormSubmission.objects.filter(pk=submission.pk, is_draft=True).update(last_saved_at=saved_at, answers_document=None):
+                return Response({'detail': 'Only drafts can be updated.'}, status=status.HTTP_400_BAD_REQUEST)
+            if answers:
+                upsert_draft_answers(submission, answers)
+        return Response({'id': str(submission.id), 'last_saved_at': saved_at, 'saved': len(answers)})
+
     @extend_schema(parameters=[OpenApiParameter(name='id', location=OpenApiParameter.PATH, type=OpenApiTypes.UUID)])
     @action(detail=True, methods=['post'], url_path='finalize')
     def finalize(self, request, form_slug=None, id=None):
@@ -98,15 +228,64 @@ class SubmissionViewSet(viewsets.ModelViewSet):
 
         # finalize atomically and trigger notifications inside transaction to ensure consistency
         with transaction.atomic():
-            submission.is_draft = False
-            submission.completed_at = timezone.now()
-            submission.save(update_fields=['is_draft', 'completed_at'])
             form = submission.form
-            if form.enable_email_notifications and form.notification_emails:
-                def _notify_finalize():
-                    for to in form.notification_emails:
-                        dispatch_notification(form, submission, f'New submission for {form.title}', 'A submission was finalized.', to)
-
-                transaction.on_commit(_notify_finalize)
+            if not form.reserve_submission_slots():
+                return Response({'detail': 'Submission limit reached for this form.'}, status=status.HTTP_403_FORBIDDEN)
+            submission.completed_at = timezone.now()
+            submission.answers_document = load_documents([submission.pk])[submission.pk] if documents_enabled() else None
+            # conditional update so a concurrent finalize cannot count the same draft twice
+            if not FormSubmission.objects.filter(pk=submission.pk, is_draft=True).update(
+                    is_draft=False, completed_at=submission.completed_at, answers_document=submission.answers_document):
+                transaction.set_rollback(True)
+                return Response({'detail': 'Submission already finalized.'}, status=status.HTTP_400_BAD_REQUEST)
+            submission.is_draft = False
+            record_submissions(form, [submission.id])
+            notify_submissions(form, [submission], f'New submission for {form.title}', 'A submission was finalized.')
 
         return Response(SubmissionSerializer(submission).data)
+
+
+class SubmissionExportViewSet(viewsets.GenericViewSet):
+    """Owner-only background exports of a form's submissions.
+
+    POST starts a job (``{"format": "csv.gz" | "ndjson" | "parquet"}``), GET on the job reports its status
+    and ``download/`` serves the finished file with HTTP Range support for resuming.
+    """
+    serializer_class = SubmissionExportSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'id'
+
+    def get_form(self):
+        form = get_object_or_404(Form, slug=self.kwargs.get('form_slug'))
+        if form.created_by != self.request.user:
+            raise PermissionDenied('Forbidden')
+        return form
+
+    def get_queryset(self):
+        return SubmissionExport.objects.filter(form=self.get_form()).order_by('-created_at')
+
+    def list(self, request, form_slug=None):
+        return Response(self.get_serializer(self.get_queryset(), many=True).data)
+
+    def create(self, request, form_slug=None):
+        form = self.get_form()
+        fmt = request.data.get('format', 'csv.gz')
+        if fmt not in available_formats():
+            return Response({'detail': f'Unsupported format. Available: {", ".join(available_formats())}'}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            export = SubmissionExport.objects.create(form=form, requested_by=request.user, format=fmt)
+            outbox.enqueue(EXPORT_TOPIC, {'export_id': str(export.id)})
+        return Response(self.get_serializer(export).data, status=status.HTTP_202_ACCEPTED)
+
+    def retrieve(self, request, form_slug=None, id=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, form_slug=None, id=None):
+        export = self.get_object()
+        if export.status != 'done':
+            return Response({'detail': f'Export is {export.status}.'}, status=status.HTTP_409_CONFLICT)
+        path = os.path.join(settings.EXPORT_ROOT, export.file_name)
+        if not os.path.exists(path):
+            return Response({'detail': 'Export file is no longer available.'}, status=status.HTTP_410_GONE)
+        return ranged_file_response(request, path, WRITERS[export.format][1], f'{export.form.slug}-submissions.{export.format}')
@@ -19,7 +19,7 @@ from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from apps.notifications.admin_views import NotificationLogViewSet, RateLimitAdminViewSet
+from apps.notifications.admin_views import NotificationLogViewSet, RateLimitAdminViewSet, MetricsView, CacheStatsView
 
 admin_router = DefaultRouter()
 admin_router.register(r'notification-logs', NotificationLogViewSet, basename='notificationlog')
@@ -33,5 +33,7 @@ urlpatterns = [
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('api/admin/metrics/', MetricsView.as_view(), name='admin-metrics'),
+    path('api/admin/cache-stats/', CacheStatsView.as_view(), name='admin-cache-stats'),
     path('api/admin/', include(admin_router.urls)),
 ]
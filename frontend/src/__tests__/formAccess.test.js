@@ -0,0 +1,28 @@
+import { vi } from 'vitest'
+import { verifyFormAccess, getFormAccessToken, withFormAccess, clearFormAccessToken } from '../../src/lib/formAccess'
+import { apiFetch } from '../../src/lib/api'
+
+vi.mock('../../src/lib/api', () => ({ apiFetch: vi.fn() }))
+
+describe('form access grants', ()=>{
+  beforeEach(()=>{
+    sessionStorage.clear()
+    apiFetch.mockReset()
+  })
+
+  it('stores the grant and attaches it to later calls', async ()=>{
+    apiFetch.mockResolvedValue({ access_token: 'g1', expires_in: 60 })
+    await verifyFormAccess('survey', 's3cret')
+    expect(apiFetch).toHaveBeenCalledWith('/api/forms/survey/verify_access/', { method: 'POST', body: { code: 's3cret' } })
+    expect(getFormAccessToken('survey')).toBe('g1')
+    expect(withFormAccess('survey', { params: { page: 2 } })).toEqual({ params: { page: 2, access_token: 'g1' } })
+    clearFormAccessToken('survey')
+    expect(withFormAccess('survey')).toEqual({})
+  })
+
+  it('drops expired grants', async ()=>{
+    apiFetch.mockResolvedValue({ access_token: 'g2', expires_in: 0 })
+    await verifyFormAccess('survey', 's3cret')
+    expect(getFormAccessToken('survey')).toBeNull()
+  })
+})
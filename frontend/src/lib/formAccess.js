@@ -0,0 +1,49 @@
+// Access grants for password-protected forms.
+// verifyFormAccess() exchanges the access code for a signed grant once; withFormAccess() attaches it
+// (as ?access_token=) to the retrieve, client-schema and submission calls for the same form.
+import { apiFetch } from './api'
+
+const STORAGE_PREFIX = 'formAccess:'
+
+export function getFormAccessToken(slug){
+  const raw = sessionStorage.getItem(STORAGE_PREFIX + slug)
+  if(!raw) return null
+  try{
+    const { token, expiresAt } = JSON.parse(raw)
+    if(Date.now() < expiresAt) return token
+  }catch(e){ /* fall through and drop the bad entry */ }
+  sessionStorage.removeItem(STORAGE_PREFIX + slug)
+  return null
+}
+
+export function clearFormAccessToken(slug){
+  sessionStorage.removeItem(STORAGE_PREFIX + slug)
+}
+
+export async function verifyFormAccess(slug, code){
+  const data = await apiFetch(`/api/forms/${slug}/verify_access/`, { method: 'POST', body: { code } })
+  sessionStorage.setItem(STORAGE_PREFIX + slug, JSON.stringify({
+    token: data.access_token,
+    expiresAt: Date.now() + data.expires_in * 1000,
+  }))
+  return data.access_token
+}
+
+export function withFormAccess(slug, options = {}){
+  const token = getFormAccessToken(slug)
+  if(!token) return options
+  return { ...options, params: { ...(options.params || {}), access_token: token } }
+}
+
+// e.g. fetchPublicForm(slug) -> throws with status 403 until verifyFormAccess() succeeds
+export function fetchPublicForm(slug){
+  return apiFetch(`/api/forms/${slug}/`, withFormAccess(slug))
+}
+
+export function fetchClientSchema(slug){
+  return apiFetch(`/api/forms/${slug}/client-schema/`, withFormAccess(slug))
+}
+
+export function submitForm(slug, answers, { isDraft = false } = {}){
+  return apiFetch(`/api/forms/${slug}/submissions/`, withFormAccess(slug, { method: 'POST', body: { answers, is_draft: isDraft } }))
+}